@@ -1,5 +1,5 @@
 import streamlit as st
-import requests
+import httpx
 
 
 def log_interaction(question, answer, file_path="./naive_qnalogs.txt"):
@@ -9,6 +9,16 @@ def log_interaction(question, answer, file_path="./naive_qnalogs.txt"):
 
 API_URL = "http://localhost:8010/query"  # Local NaiveRAG endpoint
 
+
+@st.cache_resource
+def get_http_client():
+    # One keep-alive client per process; Streamlit re-executes this script on every rerun
+    return httpx.Client(
+        timeout=120,
+        limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+        transport=httpx.HTTPTransport(retries=3),
+    )
+
 st.set_page_config(page_title="NaiveRAG - HR Assistant", page_icon="🤖", layout="centered")
 
 # --- Custom CSS for better UI ---
@@ -84,29 +94,6 @@ if query_input:
     st.session_state.pending_query = query_input
     st.rerun()
 
-# Step 2: Send query to local RAG API
-if st.session_state.pending_query:
-    payload = {
-        "query": st.session_state.pending_query,
-        "use_openai": False,
-        "use_optimize_llm": True,
-        "top_k": 100
-    }
-
-    try:
-        response = requests.post(API_URL, json=payload)
-        response.raise_for_status()
-        result = response.json()
-        reply = result["response"]
-        log_interaction(st.session_state.pending_query, reply)
-    except Exception as e:
-        reply = f"❌ Error: {e}"
-
-    # Replace the last "Thinking..." with the actual reply
-    st.session_state.chat_history[-1] = ("bot", reply)
-    st.session_state.pending_query = None
-    st.rerun()
-
 # --- Chat UI ---
 st.markdown('<div class="chat-container">', unsafe_allow_html=True)
 
@@ -135,3 +122,27 @@ for role, message in st.session_state.chat_history:
         """, unsafe_allow_html=True)
 
 st.markdown('</div>', unsafe_allow_html=True)
+
+# Step 2: Send query to local RAG API
+if st.session_state.pending_query:
+    payload = {
+        "query": st.session_state.pending_query,
+        "use_openai": False,
+        "use_optimize_llm": True,
+        "top_k": 100,
+        "stream": True
+    }
+
+    try:
+        # Render tokens as the API streams them; the full reply is kept for the history
+        with get_http_client().stream("POST", API_URL, json=payload) as response:
+            response.raise_for_status()
+            reply = st.write_stream(response.iter_text())
+        log_interaction(st.session_state.pending_query, reply)
+    except Exception as e:
+        reply = f"❌ Error: {e}"
+
+    # Replace the last "Thinking..." with the actual reply
+    st.session_state.chat_history[-1] = ("bot", reply)
+    st.session_state.pending_query = None
+    st.rerun()
@@ -1,10 +1,24 @@
-import requests
-from compare.utils import append_to_json_file, append_to_excel
+import asyncio
+import httpx
+from compare.utils import (
+    append_to_json_file,
+    append_to_excel,
+    append_many_to_json_file,
+    append_many_to_excel,
+)
 
 OPTIMIZE_RAG_API = "http://localhost:8000/api/v1/query"
 LOCAL_RAG_API = "http://localhost:8010/query"
 
-def query_optimize_rag(query):
+REQUEST_TIMEOUT = 120
+MAX_CONCURRENT_QUERIES = 8
+CHECKPOINT_EVERY = 8
+HTTP_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=32)
+
+def make_client():
+    return httpx.AsyncClient(timeout=REQUEST_TIMEOUT, limits=HTTP_LIMITS)
+
+async def query_optimize_rag(client, query):
     payload = {
         "query": query,
         "llm_provider": "azure_openai",
@@ -19,12 +33,12 @@ def query_optimize_rag(query):
         "graph_storage": "NetworkXStorage"
     }
     try:
-        res = requests.post(OPTIMIZE_RAG_API, json=payload, timeout=120)
+        res = await client.post(OPTIMIZE_RAG_API, json=payload)
         return res.json()["data"]["response"]
     except Exception as e:
         return f"❌ Error from OptimizeRag: {e}"
 
-def query_local_rag(query):
+async def query_local_rag(client, query):
     payload = {
         "query": query,
         "top_k": 100,
@@ -32,20 +46,23 @@ def query_local_rag(query):
         "use_optimize_llm": True
     }
     try:
-        res = requests.post(LOCAL_RAG_API, json=payload, timeout=120)
+        res = await client.post(LOCAL_RAG_API, json=payload)
         return res.json()["response"]
     except Exception as e:
         return f"❌ Error from Local RAG: {e}"
 
-def run_single_query_comparison(query, store=True):
-    print(f"\n🔍 Query: {query}")
-    print("⏳ Querying OptimizeRag...")
-    optimize_rag_response = query_optimize_rag(query)
-    print("✅ Got response from OptimizeRag.")
+async def run_single_query_comparison(query, store=True, client=None):
+    if client is None:
+        async with make_client() as client:
+            return await run_single_query_comparison(query, store=store, client=client)
 
-    print("⏳ Querying Local RAG...")
-    local_rag_response = query_local_rag(query)
-    print("✅ Got response from Local RAG.")
+    print(f"\n🔍 Query: {query}")
+    print("⏳ Querying OptimizeRag and Local RAG...")
+    optimize_rag_response, local_rag_response = await asyncio.gather(
+        query_optimize_rag(client, query),
+        query_local_rag(client, query),
+    )
+    print(f"✅ Got both responses for: {query[:60]}")
 
     result = {
         "query": query,
@@ -59,6 +76,36 @@ def run_single_query_comparison(query, store=True):
 
     return result
 
-def run_batch_query_comparison(queries):
-    for query in queries:
-        run_single_query_comparison(query)
+async def run_batch_query_comparison(queries, max_concurrency=MAX_CONCURRENT_QUERIES):
+    sem = asyncio.Semaphore(max_concurrency)
+    results = [None] * len(queries)
+    unsaved = []
+
+    # Checkpoint finished results every few queries (one rewrite per batch of them, not per result);
+    # the finally block keeps whatever completed if the run crashes or is interrupted
+    def checkpoint():
+        if unsaved:
+            append_many_to_json_file(unsaved)
+            append_many_to_excel(unsaved)
+            unsaved.clear()
+
+    async with make_client() as client:
+        async def bounded(i, query):
+            async with sem:
+                try:
+                    results[i] = await run_single_query_comparison(query, store=False, client=client)
+                except Exception as e:
+                    results[i] = e
+            return results[i]
+
+        try:
+            for finished in asyncio.as_completed([bounded(i, q) for i, q in enumerate(queries)]):
+                result = await finished
+                if isinstance(result, dict):
+                    unsaved.append(result)
+                    if len(unsaved) >= CHECKPOINT_EVERY:
+                        checkpoint()
+        finally:
+            checkpoint()
+
+    return results
@@ -1,13 +1,13 @@
 import streamlit as st
 import os
 import sys
-import json
+import asyncio
 
 # Add parent directory to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from compare.compare_runner import run_single_query_comparison, run_batch_query_comparison
-from compare.utils import load_queries_from_json
+from compare.utils import load_queries_from_json, load_json_stream
 
 st.set_page_config(page_title="RAG Comparison Dashboard", layout="wide")
 st.title("📊 RAG Comparison Dashboard")
@@ -18,7 +18,7 @@ st.divider()
 # --- Button to Run All Queries ---
 if st.button("🚀 Start Comparison"):
     st.success("Running queries in background...")
-    run_batch_query_comparison(load_queries_from_json())
+    asyncio.run(run_batch_query_comparison(load_queries_from_json()))
     st.success("✅ All queries processed. Check result.json or result.xlsx.")
 
 st.divider()
@@ -28,7 +28,7 @@ st.subheader("🔎 Test a Custom Query")
 custom_query = st.text_input("Enter your query and compare both RAGs")
 
 if st.button("Run Custom Comparison") and custom_query.strip():
-    result = run_single_query_comparison(custom_query, store=False)
+    result = asyncio.run(run_single_query_comparison(custom_query, store=False))
 
     st.markdown(f"#### 🔍 Query: {custom_query}")
     col1, col2 = st.columns(2)
@@ -46,10 +46,15 @@ st.divider()
 # --- Load and Display Past Results ---
 st.subheader("📜 Past Comparison Logs")
 
+@st.cache_data
+def load_past_results(path, mtime):
+    # mtime is part of the cache key, so the log is re-parsed only when it changes
+    with open(path, "r", encoding="utf-8") as f:
+        return load_json_stream(f)
+
 result_path = os.path.join("compare", "result.json")
 if os.path.exists(result_path):
-    with open(result_path, "r", encoding="utf-8") as f:
-        results = json.load(f)
+    results = load_past_results(result_path, os.path.getmtime(result_path))
 
     for result in results[::-1]:
         with st.expander(f"🔍 {result['query'][:100]}"):
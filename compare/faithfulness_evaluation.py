@@ -1,10 +1,17 @@
 import os
+import re
+import sys
 import json
 import logging
+from collections import Counter
 from dotenv import load_dotenv
 import asyncio
 import httpx
 
+# Shared helpers live under src/; make them importable when this file is run as a script
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from common.json_io import load_json_stream, dump_json_stream, load_query_log
+
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
 
@@ -12,7 +19,7 @@ logging.basicConfig(level=logging.INFO)
 import google.generativeai as genai
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 genai.configure(api_key=GEMINI_API_KEY)
-gemini_model = genai.GenerativeModel("gemini-1.5-flash-latest")
+GEMINI_MODEL_NAME = "gemini-1.5-flash-latest"
 
 # === Azure setup ===
 AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
@@ -28,12 +35,71 @@ INPUT_FILES = {
 OUTPUT_FOLDER = "evaluated_logs"
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
+# Score / verdict extraction from judge output
+_SCORE_RE = re.compile(r"score\W{0,6}?(\d+)", re.IGNORECASE)
+_PREF_RE = re.compile(r"preferred\s+system\W{0,6}?(optimize|naive|equal)", re.IGNORECASE)
+
+# Max judge calls in flight at once
+MAX_CONCURRENT_EVALS = int(os.getenv("MAX_CONCURRENT_EVALS", "8"))
+
+# === Shared HTTP client (keep-alive connections reused across judge calls) ===
+_http_client = None
+
+def get_http_client():
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=60,
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+        )
+    return _http_client
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+# === Judge instructions ===
+# Invariant task/format text is sent as the system message so the provider can reuse
+# the cached prefix; only the query/context/response part changes per request.
+EVALUATION_SYSTEM_PROMPT = """You are a judge evaluating faithfulness of RAG system outputs.
+
+### Task
+Evaluate how faithfully the given **response** is grounded in the provided **context** for a user **query**. Give a faithfulness score (0 to 10) and briefly explain if any hallucinations are present.
+
+### Evaluation Format:
+Faithfulness Score: X  (numeric between 0-10)
+Hallucinations: (explain what was added or inferred without evidence)
+"""
+
+HEAD_TO_HEAD_SYSTEM_PROMPT = """You are a judge evaluating faithfulness of RAG system outputs.
 
-def make_evaluation_prompt(query, context, response):
-    return f"""
 ### Task
-Evaluate how faithfully the following **response** is grounded in the provided **context** for a user **query**. Give a faithfulness score (0 to 10) and briefly explain if any hallucinations are present.
+Compare the two RAG systems (OptimizeRAG and NaiveRAG) based on their responses and context for the user query. Determine which response is more faithful, helpful, and complete **given its own context**.
+
+Be fair to both systems: judge each response **only against its own context**. If both are equally good or equally bad, mark it as "equal".
+
+Then, analyze how the two responses differ in actual content. Mention differences in:
+- Information included or omitted
+- Specific claims made
+- Level of detail
+- Any assumptions or inferences
+Do **not** mention formatting, language style, or tone differences.
+
+### Evaluation Format:
+Preferred System: optimize | naive | equal  
+Reason: (brief explanation why one was preferred or if both were equal)  
+Differences: (how the responses differ in content — include examples if helpful)
+"""
+
+gemini_eval_model = genai.GenerativeModel(GEMINI_MODEL_NAME, system_instruction=EVALUATION_SYSTEM_PROMPT)
+gemini_h2h_model = genai.GenerativeModel(GEMINI_MODEL_NAME, system_instruction=HEAD_TO_HEAD_SYSTEM_PROMPT)
+
 
+def make_evaluation_prompt(query, context, response):
+    return f"""
 ### Query:
 {query}
 
@@ -42,32 +108,52 @@ Evaluate how faithfully the following **response** is grounded in the provided *
 
 ### Response:
 {response}
+"""
 
-### Evaluation Format:
-Faithfulness Score: X  (numeric between 0-10)
-Hallucinations: (explain what was added or inferred without evidence)
+
+def make_head_to_head_prompt(query, opt_context, opt_response, naive_context, naive_response):
+    return f"""
+### Query:
+{query}
+
+---
+
+### OptimizeRAG
+Context:
+{opt_context}
+
+Response:
+{opt_response}
+
+---
+
+### NaiveRAG
+Context:
+{naive_context}
+
+Response:
+{naive_response}
 """
 
 
-async def evaluate_with_azure(prompt):
+async def evaluate_with_azure(prompt, system_prompt=EVALUATION_SYSTEM_PROMPT):
     headers = {
         "Content-Type": "application/json",
         "api-key": AZURE_OPENAI_API_KEY,
     }
     body = {
         "messages": [
-            {"role": "system", "content": "You are a judge evaluating faithfulness of RAG system outputs."},
+            {"role": "system", "content": system_prompt},
             {"role": "user", "content": prompt},
         ],
         "temperature": 0.3,
         "max_tokens": 1024,
     }
     url = f"{AZURE_OPENAI_ENDPOINT}/openai/deployments/{AZURE_OPENAI_DEPLOYMENT}/chat/completions?api-version={AZURE_OPENAI_API_VERSION}"
-    async with httpx.AsyncClient(timeout=60) as client:
-        res = await client.post(url, headers=headers, json=body)
-        res.raise_for_status()
-        result = res.json()
-        return result["choices"][0]["message"]["content"]
+    res = await get_http_client().post(url, headers=headers, json=body)
+    res.raise_for_status()
+    result = res.json()
+    return result["choices"][0]["message"]["content"]
 
 
 async def evaluate_entry(entry, use_azure=False):
@@ -76,11 +162,11 @@ async def evaluate_entry(entry, use_azure=False):
         if use_azure:
             text = await evaluate_with_azure(prompt)
         else:
-            response = gemini_model.generate_content(prompt)
+            response = await asyncio.to_thread(gemini_eval_model.generate_content, prompt)
             text = response.text.strip()
 
-        score_line = next((line for line in text.splitlines() if "score" in line.lower()), "")
-        score = int("".join(filter(str.isdigit, score_line))) if score_line else None
+        match = _SCORE_RE.search(text)
+        score = int(match.group(1)) if match else None
 
         return {
             **entry,
@@ -101,14 +187,13 @@ async def run_evaluation(source: str, use_azure: bool = False):
     input_path = INPUT_FILES[source]
     output_path = os.path.join(OUTPUT_FOLDER, f"{source}_evaluated.json")
 
-    with open(input_path, "r", encoding="utf-8") as f:
-        all_entries = json.load(f)
+    all_entries = load_query_log(input_path)
 
     # Load existing evaluations if any
     if os.path.exists(output_path):
         with open(output_path, "r", encoding="utf-8") as f:
             try:
-                evaluated_entries = json.load(f)
+                evaluated_entries = load_json_stream(f)
             except json.JSONDecodeError:
                 evaluated_entries = []
     else:
@@ -119,18 +204,23 @@ async def run_evaluation(source: str, use_azure: bool = False):
         (entry["query"], entry["response"]) for entry in evaluated_entries
     }
 
-    new_results = []
-    for entry in all_entries:
-        identifier = (entry["query"], entry["response"])
-        if identifier in evaluated_set:
-            continue  # Already evaluated
-        result = await evaluate_entry(entry, use_azure)
-        new_results.append(result)
+    pending = [
+        entry for entry in all_entries
+        if (entry["query"], entry["response"]) not in evaluated_set
+    ]
+
+    sem = asyncio.Semaphore(MAX_CONCURRENT_EVALS)
+
+    async def bounded_evaluate(entry):
+        async with sem:
+            return await evaluate_entry(entry, use_azure)
+
+    new_results = list(await asyncio.gather(*(bounded_evaluate(e) for e in pending)))
 
     full_results = evaluated_entries + new_results
 
     with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(full_results, f, indent=2, ensure_ascii=False)
+        dump_json_stream(full_results, f)
 
     print(f"✅ Evaluated {len(new_results)} new entries. Total: {len(full_results)} saved to {output_path}")
 
@@ -141,62 +231,26 @@ async def head_to_head_evaluate(opt_entry, naive_entry, use_azure=False):
     opt_response = opt_entry["response"]
     naive_response = naive_entry["response"]
 
-    prompt = f"""
-### Task
-Compare the two RAG systems (OptimizeRAG and NaiveRAG) based on their responses and context for the user query. Determine which response is more faithful, helpful, and complete **given its own context**.
-
-Be fair to both systems: judge each response **only against its own context**. If both are equally good or equally bad, mark it as "equal".
-
-Then, analyze how the two responses differ in actual content. Mention differences in:
-- Information included or omitted
-- Specific claims made
-- Level of detail
-- Any assumptions or inferences
-Do **not** mention formatting, language style, or tone differences.
-
----
-
-### Query:
-{query}
-
----
-
-### OptimizeRAG
-Context:
-{opt_context}
-
-Response:
-{opt_response}
-
----
-
-### NaiveRAG
-Context:
-{naive_context}
-
-Response:
-{naive_response}
-
----
-
-### Evaluation Format:
-Preferred System: optimize | naive | equal  
-Reason: (brief explanation why one was preferred or if both were equal)  
-Differences: (how the responses differ in content — include examples if helpful)
-"""
+    prompt = make_head_to_head_prompt(query, opt_context, opt_response, naive_context, naive_response)
     try:
         if use_azure:
-            result_text = await evaluate_with_azure(prompt)
+            result_text = await evaluate_with_azure(prompt, HEAD_TO_HEAD_SYSTEM_PROMPT)
         else:
-            result_text = gemini_model.generate_content(prompt).text.strip()
+            response = await asyncio.to_thread(gemini_h2h_model.generate_content, prompt)
+            result_text = response.text.strip()
 
-        # Naive extraction of preferred system
-        if "optimize" in result_text.lower():
-            preferred = "optimize"
-        elif "naive" in result_text.lower():
-            preferred = "naive"
+        match = _PREF_RE.search(result_text)
+        if match:
+            preferred = match.group(1).lower()
         else:
-            preferred = "equal"
+            # Fall back to the first system mentioned anywhere in the reply
+            lowered = result_text.lower()
+            if "optimize" in lowered:
+                preferred = "optimize"
+            elif "naive" in lowered:
+                preferred = "naive"
+            else:
+                preferred = "equal"
 
         return {
             "query": query,
@@ -217,36 +271,43 @@ async def run_head_to_head(use_azure=False):
     output_path = os.path.join(OUTPUT_FOLDER, "head_to_head_comparison.json")
 
     with open(path_opt, "r", encoding="utf-8") as f:
-        opt_entries = json.load(f)
+        opt_entries = load_json_stream(f)
     with open(path_naive, "r", encoding="utf-8") as f:
-        naive_entries = json.load(f)
+        naive_entries = load_json_stream(f)
 
-    # Match queries
+    # Pair matched entries up front; unmatched queries are dropped before any LLM call
     naive_lookup = {e["query"]: e for e in naive_entries}
-    comparisons = []
+    pairs = [(o, naive_lookup[o["query"]]) for o in opt_entries if o["query"] in naive_lookup]
+    skipped = len(opt_entries) - len(pairs)
+
+    print(f"🔄 Starting head-to-head evaluation... Total queries: {len(opt_entries)} | Matched: {len(pairs)}")
+    if skipped:
+        print(f"⚠️  Skipping {skipped} queries with no matching NaiveRAG response")
 
-    print(f"🔄 Starting head-to-head evaluation... Total queries: {len(opt_entries)}")
+    sem = asyncio.Semaphore(MAX_CONCURRENT_EVALS)
 
+    async def bounded_compare(opt_entry, naive_entry):
+        async with sem:
+            return await head_to_head_evaluate(opt_entry, naive_entry, use_azure)
 
-    for idx, opt_entry in enumerate(opt_entries, start=1):
-        query = opt_entry["query"]
-        if query not in naive_lookup:
-            print(f"⚠️  Skipping: No matching NaiveRAG response for query [{query}]")
-            continue
-        naive_entry = naive_lookup[query]
-        result = await head_to_head_evaluate(opt_entry, naive_entry, use_azure)
-        comparisons.append(result)
+    comparisons = list(await asyncio.gather(*(bounded_compare(o, n) for o, n in pairs)))
 
-        print(f"[{idx}/{len(opt_entries)}] ✅ Query: {query[:60]}...")
-        print(f"   ↪ Preferred: {result['preferred_system']}")
-        print(f"   🧠 Reason: {result['llm_reasoning'].splitlines()[0]}\n")
+    tally = Counter(c["preferred_system"] for c in comparisons)
+    print(f"📊 Preferred: optimize={tally['optimize']} | naive={tally['naive']} | equal={tally['equal']} | failed={tally[None]}")
 
     with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(comparisons, f, indent=2, ensure_ascii=False)
+        dump_json_stream(comparisons, f)
 
     print(f"✅ Head-to-head comparison done. Saved to: {output_path}")
 
 
+async def run_and_close(coro):
+    try:
+        return await coro
+    finally:
+        await close_http_client()
+
+
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
@@ -256,8 +317,8 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     if args.compare:
-        asyncio.run(run_head_to_head(use_azure=args.use_azure))
+        asyncio.run(run_and_close(run_head_to_head(use_azure=args.use_azure)))
     elif args.source:
-        asyncio.run(run_evaluation(args.source, use_azure=args.use_azure))
+        asyncio.run(run_and_close(run_evaluation(args.source, use_azure=args.use_azure)))
     else:
         parser.print_help()
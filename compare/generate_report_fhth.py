@@ -1,7 +1,12 @@
-import json
+import os
+import sys
 import pandas as pd
 from pathlib import Path
 
+# Shared helpers live under src/; make them importable when this file is run as a script
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from common.json_io import load_json
+
 # Paths to input files
 base_path = Path("compare/evaluated_logs")
 
@@ -9,34 +14,41 @@ opt_path = base_path / "optimize_evaluated.json"
 naive_path = base_path / "naive_evaluated.json"
 compare_path = base_path / "head_to_head_comparison.json"
 
+def load_frame(path, columns):
+    """Load a JSON list of records, keep one row per query and rename to report columns."""
+    df = pd.DataFrame(load_json(path))
+    df = df.reindex(columns=["query", *columns]).drop_duplicates("query", keep="last")
+    return df.rename(columns=columns)
+
 # Load JSONs
-with open(opt_path, "r", encoding="utf-8") as f:
-    opt_data = {e["query"]: e for e in json.load(f)}
-with open(naive_path, "r", encoding="utf-8") as f:
-    naive_data = {e["query"]: e for e in json.load(f)}
-with open(compare_path, "r", encoding="utf-8") as f:
-    compare_data = {e["query"]: e for e in json.load(f)}
+opt_df = load_frame(opt_path, {
+    "response": "OptimizeRAG_Response",
+    "faithfulness_score": "OptimizeRAG_Score",
+    "llm_explanation": "OptimizeRAG_Explanation",
+})
+naive_df = load_frame(naive_path, {
+    "response": "NaiveRAG_Response",
+    "faithfulness_score": "NaiveRAG_Score",
+    "llm_explanation": "NaiveRAG_Explanation",
+})
+compare_df = load_frame(compare_path, {
+    "llm_reasoning": "LLM_Comparison_Reasoning",
+})
 
 # Merge by query
-all_queries = set(opt_data) | set(naive_data) | set(compare_data)
-rows = []
-for query in all_queries:
-    o = opt_data.get(query, {})
-    n = naive_data.get(query, {})
-    c = compare_data.get(query, {})
-
-    rows.append({
-        "Query": query,
-        "OptimizeRAG_Response": o.get("response", ""),
-        "OptimizeRAG_Score": o.get("faithfulness_score", ""),
-        "OptimizeRAG_Explanation": o.get("llm_explanation", ""),
-        "NaiveRAG_Response": n.get("response", ""),
-        "NaiveRAG_Score": n.get("faithfulness_score", ""),
-        "NaiveRAG_Explanation": n.get("llm_explanation", ""),
-        "LLM_Comparison_Reasoning": c.get("llm_reasoning", "")
-    })
+df = (
+    opt_df
+    .merge(naive_df, on="query", how="outer")
+    .merge(compare_df, on="query", how="outer")
+    .rename(columns={"query": "Query"})
+    .fillna("")
+)
 
 # Save to Excel
-df = pd.DataFrame(rows)
-df.to_excel("compare/evaluated_logs/rag_evaluation_combined.xlsx", index=False)
+with pd.ExcelWriter(
+    "compare/evaluated_logs/rag_evaluation_combined.xlsx",
+    engine="xlsxwriter",
+    engine_kwargs={"options": {"strings_to_urls": False}},
+) as writer:
+    df.to_excel(writer, index=False)
 print("✅ Excel file saved: rag_evaluation_combined.xlsx")
@@ -1,23 +1,37 @@
-import json
+import os
+import sys
 import openpyxl
 from datetime import datetime
 
+# Shared helpers live under src/; make them importable when this file is run as a script
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+from common.json_io import load_json_stream, dump_json_stream
+
+
 def load_queries_from_json(file_path="compare/queries.json"):
     with open(file_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+        return load_json_stream(f)
 
 def append_to_json_file(data, file_path="compare/result.json"):
+    append_many_to_json_file([data], file_path)
+
+def append_many_to_json_file(items, file_path="compare/result.json"):
+    # Read and rewrite the file once for the whole batch rather than once per result
     existing = []
     try:
         with open(file_path, "r", encoding="utf-8") as f:
-            existing = json.load(f)
+            existing = load_json_stream(f)
     except FileNotFoundError:
         pass
-    existing.append(data)
+    existing.extend(items)
     with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(existing, f, indent=2, ensure_ascii=False)
+        dump_json_stream(existing, f)
 
 def append_to_excel(data, file_path="compare/result.xlsx"):
+    append_many_to_excel([data], file_path)
+
+def append_many_to_excel(items, file_path="compare/result.xlsx"):
+    # Load and save the workbook once for the whole batch rather than once per row
     try:
         wb = openpyxl.load_workbook(file_path)
         ws = wb.active
@@ -26,10 +40,12 @@ def append_to_excel(data, file_path="compare/result.xlsx"):
         ws = wb.active
         ws.append(["Query", "OptimizeRag Response", "Local RAG Response", "Timestamp"])
 
-    ws.append([
-        data["query"],
-        data["optimize_rag_response"],
-        data["local_rag_response"],
-        datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    ])
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for data in items:
+        ws.append([
+            data["query"],
+            data["optimize_rag_response"],
+            data["local_rag_response"],
+            timestamp
+        ])
     wb.save(file_path)
@@ -1,10 +1,12 @@
 from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from pipeline.pipeline import RAGPipeline
+from pipeline.batcher import QueryBatcher
 import uvicorn
 
 app = FastAPI()
@@ -15,14 +17,26 @@ class QueryRequest(BaseModel):
     use_openai: bool = False
     use_optimize_llm: bool = True
     top_k: int = 50
+    stream: bool = False
 
 # Initialize pipeline once
 pipeline = None
+batcher = None
 
 @app.on_event("startup")
 async def startup_event():
-    global pipeline
+    global pipeline, batcher
     pipeline = RAGPipeline(use_openai=False, use_optimize_llm=True)
+    # Concurrent requests share one embedding + vector search call
+    batcher = QueryBatcher(pipeline.retriever)
+    batcher.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if batcher is not None:
+        await batcher.stop()
+    if pipeline is not None:
+        await pipeline.generator.aclose()
 
 @app.post("/query")
 async def query_rag(request: QueryRequest):
@@ -35,7 +49,15 @@ async def query_rag(request: QueryRequest):
     print(f"🔍 Query: {request.query}")
     print(f"🔧 top_k: {request.top_k}, use_openai: {request.use_openai}, use_optimize_llm: {request.use_optimize_llm}")
 
-    retrieved_chunks = pipeline.retriever.query(request.query, top_k=request.top_k)
+    retrieved_chunks = await batcher.query(request.query, request.top_k)
+
+    if request.stream:
+        # Send tokens as they are decoded instead of waiting for the full answer
+        return StreamingResponse(
+            pipeline.generator.stream_response(request.query, retrieved_chunks),
+            media_type="text/plain; charset=utf-8",
+        )
+
     answer, response = await pipeline.generator.generate_response(request.query, retrieved_chunks)
     return {"response": response}
 
@@ -0,0 +1,50 @@
+import json
+from pathlib import Path
+
+# orjson when installed (several times faster on the large eval/gold files), stdlib json otherwise
+try:
+    import orjson
+
+    loads = orjson.loads
+
+    def dumps(obj, indent=False):
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, option=option).decode()
+
+    def load_json_stream(f):
+        return orjson.loads(f.read())
+
+    def dump_json_stream(obj, f):
+        f.write(dumps(obj, indent=True))
+except ImportError:
+    loads = json.loads
+
+    def dumps(obj, indent=False):
+        return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None)
+
+    def load_json_stream(f):
+        return json.load(f)
+
+    def dump_json_stream(obj, f):
+        json.dump(obj, f, indent=2, ensure_ascii=False)
+
+
+def load_json(path):
+    with open(path, "rb") as f:
+        return load_json_stream(f)
+
+
+# Query logs: the naive pipeline now appends JSON Lines next to the configured .json log. Records from
+# an older single-array file are kept, and when a query was logged more than once the latest entry wins.
+def load_query_log(path):
+    path = Path(path)
+    jsonl_path = path.with_suffix(".jsonl")
+    if not jsonl_path.exists():
+        return load_json(path)
+    records = load_json(path) if path.exists() else []
+    with open(jsonl_path, encoding="utf-8") as f:
+        records += [loads(line) for line in f if line.strip()]
+    latest = {}
+    for record in records:
+        latest[record["query"]] = record
+    return list(latest.values())
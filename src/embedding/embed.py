@@ -1,86 +1,216 @@
 import os
+import sys
 import json
+import hashlib
 import logging
-from tqdm import tqdm
+import sqlite3
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import torch
 from sentence_transformers import SentenceTransformer
 
+# Shared helpers live under src/; make them importable when this file is run as a script
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.json_io import loads
+
 # === LOGGING ===
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+# === CONFIG ===
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# Files processed concurrently; disk I/O and JSON work overlap with model compute
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "4"))
+# Storage precision for vectors written to data/embeddings: float32 | float16 | int8
+EMBED_STORAGE_DTYPE = os.getenv("EMBED_STORAGE_DTYPE", "float32").lower()
+# Dynamic int8 quantization of the model's Linear layers when running on CPU
+EMBED_CPU_INT8 = os.getenv("EMBED_CPU_INT8", "false").lower() == "true"
+# torch.compile the transformer when running on GPU. Opt-in: startup pays the compile cost, and any
+# Dynamo/Inductor failure during the warm-up encode falls back to the eager model
+EMBED_TORCH_COMPILE = os.getenv("EMBED_TORCH_COMPILE", "false").lower() == "true"
+# Persistent content-hash -> embedding cache, so unchanged chunks are never re-encoded
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "data/emb_cache/embeddings.sqlite3")
+
+
+def quantize_int8(embs):
+    """Symmetric per-vector int8 quantization. Returns (int8 matrix, float32 scales)."""
+    max_abs = np.max(np.abs(embs), axis=1, keepdims=True)
+    max_abs[max_abs == 0] = 1.0
+    q = np.round(embs * 127 / max_abs).astype(np.int8)
+    return q, (max_abs[:, 0] / 127).astype(np.float32)
+
+
+class EmbeddingCache:
+    """SQLite-backed map of sha256(model_name::text) -> float32 embedding bytes."""
+
+    def __init__(self, path, model_name):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.model_name = model_name
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)")
+        self.conn.commit()
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.model_name}::{text}".encode("utf-8")).digest()
+
+    def get_many(self, keys):
+        found = {}
+        with self.lock:
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update((k, np.frombuffer(v, dtype=np.float32)) for k, v in rows)
+        return found
+
+    def set_many(self, items):
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(k, np.asarray(v, dtype=np.float32).tobytes()) for k, v in items]
+            )
+            self.conn.commit()
+
+
 class EmbeddingGenerator:
     def __init__(self, input_dir="data/chunked_resumes", output_dir="data/embeddings", model_name="BAAI/bge-base-en-v1.5"):
         self.input_dir = input_dir
         self.output_dir = output_dir
         self.model_name = model_name
+        self.encode_lock = threading.Lock()
 
         os.makedirs(self.output_dir, exist_ok=True)
+        self.cache = EmbeddingCache(EMBED_CACHE_PATH, model_name)
 
-        logging.info(f"🔄 Loading embedding model: {model_name}")
-        self.model = SentenceTransformer(model_name)
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        logging.info(f"🔄 Loading embedding model: {model_name} on {self.device}")
+        self.model = SentenceTransformer(model_name, device=self.device)
 
-    def load_jsonl(self, filepath):
-        data = []
-        try:
-            with open(filepath, "r", encoding="utf-8") as file:
-                for line in file:
-                    data.append(json.loads(line.strip()))
-            return data
-        except Exception as e:
-            logging.error(f"❌ Error loading {filepath}: {e}")
-            return []
+        if self.device == "cuda":
+            self.model.half()
+            logging.info("⚡ Running embedding model in FP16 on GPU")
+            if EMBED_TORCH_COMPILE:
+                # Compilation is lazy, so run one encode here; dynamic shapes cover the varying padded
+                # lengths and batch sizes without recompiling for each one
+                eager_model = self.model[0].auto_model
+                try:
+                    self.model[0].auto_model = torch.compile(eager_model, dynamic=True)
+                    self.model.encode(["warm-up", "torch.compile warm-up batch"], normalize_embeddings=True)
+                    logging.info("⚡ Compiled transformer with torch.compile")
+                except Exception as e:
+                    self.model[0].auto_model = eager_model
+                    logging.warning(f"⚠️ torch.compile failed, using eager mode: {e}")
+        elif EMBED_CPU_INT8:
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+            logging.info("⚡ Running embedding model with dynamic int8 quantization on CPU")
 
-    def save_jsonl(self, filename, data):
-        output_path = os.path.join(self.output_dir, filename)
-        try:
-            with open(output_path, "w", encoding="utf-8") as file:
-                for entry in data:
-                    json.dump(entry, file, ensure_ascii=False)
-                    file.write("\n")
-            logging.info(f"✅ Saved embeddings to {output_path}")
-        except Exception as e:
-            logging.error(f"❌ Error saving embeddings for {filename}: {e}")
+    def iter_jsonl(self, filepath):
+        with open(filepath, "r", encoding="utf-8") as file:
+            for line in file:
+                line = line.strip()
+                if line:
+                    yield loads(line)
 
     def embed_text(self, text):
         try:
-            prompt = f"Represent this chunk for retrieval: {text}"
-            return self.model.encode(text, normalize_embeddings=True).tolist()
+            with self.encode_lock:
+                return self.model.encode(text, normalize_embeddings=True).tolist()
         except Exception as e:
             logging.error(f"❌ Embedding error: {e}")
             return None
 
+    def embed_texts(self, texts):
+        try:
+            keys = [self.cache.key(t) for t in texts]
+            cached = self.cache.get_many(keys)
+            miss_idx = [i for i, k in enumerate(keys) if k not in cached]
+            logging.info(f"💾 Embedding cache: {len(texts) - len(miss_idx)} hits, {len(miss_idx)} misses")
+
+            if miss_idx:
+                with self.encode_lock:
+                    new_embs = self.model.encode(
+                        [texts[i] for i in miss_idx],
+                        batch_size=EMBED_BATCH_SIZE,
+                        normalize_embeddings=True,
+                        convert_to_numpy=True,
+                        show_progress_bar=False
+                    )
+                new_items = [(keys[i], emb) for i, emb in zip(miss_idx, new_embs)]
+                self.cache.set_many(new_items)
+                cached.update(new_items)
+
+            return np.stack([np.asarray(cached[k], dtype=np.float32) for k in keys])
+        except Exception as e:
+            logging.error(f"❌ Batch embedding error: {e}")
+            return None
+
+    def to_storage(self, embs):
+        embs = np.asarray(embs, dtype=np.float32)
+        if EMBED_STORAGE_DTYPE == "int8":
+            q, scales = quantize_int8(embs)
+            return [
+                {"embedding": row.tolist(), "embedding_scale": float(scale)}
+                for row, scale in zip(q, scales)
+            ]
+        if EMBED_STORAGE_DTYPE == "float16":
+            embs = embs.astype(np.float16)
+        return [{"embedding": row.tolist()} for row in embs]
+
     def process_file(self, filepath):
         filename = os.path.basename(filepath)
         output_filepath = os.path.join(self.output_dir, filename)
-        if os.path.exists(output_filepath):
-            logging.info(f"⏭️ Skipping {filename}, embeddings already exist.")
+        if os.path.exists(output_filepath) and os.path.getmtime(output_filepath) >= os.path.getmtime(filepath):
+            logging.info(f"⏭️ Skipping {filename}, embeddings are up to date.")
+            return
+
+        output_tmp = output_filepath + ".tmp"
+        written = 0
+        try:
+            chunks = (c for c in self.iter_jsonl(filepath) if c.get("text", "").strip())
+            with open(output_tmp, "w", encoding="utf-8") as out:
+                # Pull, embed and write EMBED_BATCH_SIZE chunks at a time instead of holding the whole file
+                while batch := list(islice(chunks, EMBED_BATCH_SIZE)):
+                    texts = [c["text"].strip() for c in batch]
+                    embs = self.embed_texts(texts)
+                    if embs is None:
+                        raise RuntimeError("embedding failed")
+
+                    for chunk, text, vec in zip(batch, texts, self.to_storage(embs)):
+                        json.dump({
+                            "chunk_id": chunk.get("chunk_id"),
+                            "text": text,
+                            "source": chunk.get("source"),
+                            **vec
+                        }, out, ensure_ascii=False)
+                        out.write("\n")
+                    written += len(batch)
+        except Exception as e:
+            logging.error(f"❌ Error embedding {filename}: {e}")
+            if os.path.exists(output_tmp):
+                os.remove(output_tmp)
             return
 
-        chunks = self.load_jsonl(filepath)
-        if not chunks:
+        if not written:
             logging.warning(f"⚠️ Skipping {filename}, no valid chunks.")
+            os.remove(output_tmp)
             return
 
-        embedded = []
-        for chunk in tqdm(chunks, desc=f"Embedding {filename}", leave=False):
-            text = chunk.get("text", "").strip()
-            if not text:
-                continue
-            emb = self.embed_text(text)
-            if emb:
-                embedded.append({
-                    "chunk_id": chunk.get("chunk_id"),
-                    "text": text,
-                    "source": chunk.get("source"),
-                    "embedding": emb
-                })
-
-        if embedded:
-            self.save_jsonl(filename, embedded)
+        os.replace(output_tmp, output_filepath)
+        logging.info(f"✅ Saved {written} embeddings to {output_filepath}")
 
     def run(self):
-        files = [f for f in os.listdir(self.input_dir) if f.endswith(".jsonl")]
-        for file in files:
-            self.process_file(os.path.join(self.input_dir, file))
+        paths = [
+            os.path.join(self.input_dir, f)
+            for f in os.listdir(self.input_dir) if f.endswith(".jsonl")
+        ]
+        # encode() is serialized by encode_lock; loading/saving of other files runs alongside it
+        with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as executor:
+            list(executor.map(self.process_file, paths))
 
 if __name__ == "__main__":
     EmbeddingGenerator().run()
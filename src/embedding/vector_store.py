@@ -1,12 +1,29 @@
 import os
-import json
+import sys
 import logging
+from itertools import islice
 import chromadb
-from tqdm import tqdm
+import numpy as np
+
+# Shared helpers live under src/; make them importable when this file is run as a script
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.json_io import loads
 
 # === LOGGING ===
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+# Records read from a file and inserted per add_embeddings call
+INSERT_BATCH_SIZE = int(os.getenv("VECTOR_INSERT_BATCH_SIZE", "1000"))
+
+# === HNSW INDEX CONFIG ===
+# Only applied when the collection is created; existing collections keep their settings.
+HNSW_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:M": 32,
+    "hnsw:construction_ef": 200,
+    "hnsw:search_ef": 128,
+}
+
 class VectorStore:
     def __init__(self, input_dir="data/embeddings", db_dir="data/vector_db", collection_name="resumes"):
         self.input_dir = input_dir
@@ -16,53 +33,65 @@ class VectorStore:
         os.makedirs(self.db_dir, exist_ok=True)
 
         self.client = chromadb.PersistentClient(path=self.db_dir)
-        self.collection = self.client.get_or_create_collection(name=self.collection_name)
+        self.collection = self.client.get_or_create_collection(
+            name=self.collection_name,
+            metadata=HNSW_METADATA
+        )
 
-    def load_jsonl(self, filepath):
-        data = []
-        try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                for line in f:
-                    data.append(json.loads(line.strip()))
-            return data
-        except Exception as e:
-            logging.error(f"❌ Failed to load {filepath}: {e}")
-            return []
+    def iter_jsonl(self, filepath):
+        with open(filepath, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield loads(line)
 
-    def chunk_exists(self, chunk_id):
-        try:
-            existing = self.collection.get(ids=[chunk_id])
-            return bool(existing["ids"])
-        except:
-            return False
+    def get_vector(self, rec):
+        # int8-quantized records carry a per-vector scale; dequantize before insert
+        if "embedding_scale" in rec:
+            return (np.asarray(rec["embedding"], dtype=np.float32) * rec["embedding_scale"]).tolist()
+        return rec["embedding"]
 
     def add_embeddings(self, records):
-        added, skipped = 0, 0
-        for rec in tqdm(records, desc="📥 Adding to Vector DB"):
+        ids = [rec["chunk_id"] for rec in records]
+        try:
+            existing = set(self.collection.get(ids=ids, include=[])["ids"])
+        except Exception as e:
+            logging.warning(f"⚠️ Could not fetch existing ids: {e}")
+            existing = set()
+
+        seen = set()
+        new_records = []
+        for rec in records:
             chunk_id = rec["chunk_id"]
-            if self.chunk_exists(chunk_id):
-                skipped += 1
+            if chunk_id in existing or chunk_id in seen:
                 continue
+            seen.add(chunk_id)
+            new_records.append(rec)
+        skipped = len(records) - len(new_records)
 
+        if new_records:
+            logging.info(f"📥 Adding {len(new_records)} records to Vector DB")
             self.collection.add(
-                ids=[chunk_id],
-                embeddings=[rec["embedding"]],
-                documents=[rec["text"]],
+                ids=[rec["chunk_id"] for rec in new_records],
+                embeddings=[self.get_vector(rec) for rec in new_records],
+                documents=[rec["text"] for rec in new_records],
                 metadatas=[{
                     "source": rec["source"],
                     "text": rec["text"]
-                }]
+                } for rec in new_records]
             )
-            added += 1
-        logging.info(f"✅ Added {added}, Skipped {skipped}")
+        logging.info(f"✅ Added {len(new_records)}, Skipped {skipped}")
 
     def process(self):
         files = [f for f in os.listdir(self.input_dir) if f.endswith(".jsonl")]
         for file in files:
             logging.info(f"🔍 Processing {file}")
-            data = self.load_jsonl(os.path.join(self.input_dir, file))
-            if data:
-                self.add_embeddings(data)
+            try:
+                records = self.iter_jsonl(os.path.join(self.input_dir, file))
+                while batch := list(islice(records, INSERT_BATCH_SIZE)):
+                    self.add_embeddings(batch)
+            except Exception as e:
+                logging.error(f"❌ Failed to load {file}: {e}")
 
     def run(self):
         self.process()
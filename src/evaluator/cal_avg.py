@@ -1,4 +1,5 @@
 import json
+import pandas as pd
 
 # === FILE PATHS ===
 naive_file = "data/eval_results/naive_eval_v2.json"
@@ -24,19 +25,22 @@ with open(null_queries_file, encoding="utf-8") as f:
 null_query_texts = {item["query_text"] for item in null_queries}
 
 def filter_valid(data):
-    return [entry for entry in data if entry["query"] not in null_query_texts]
+    # Nested metric dicts become dotted columns, e.g. "context_recall.score"
+    df = pd.json_normalize(data)
+    if df.empty or "query" not in df:
+        return df
+    return df[~df["query"].isin(null_query_texts)]
 
 naive_filtered = filter_valid(naive_data)
 optimize_filtered = filter_valid(optimize_data)
 
 # === AVERAGE CALCULATOR ===
 def calculate_avg(filtered, key):
-    scores = [
-        entry[key]["score"]
-        for entry in filtered
-        if key in entry and isinstance(entry[key], dict)
-    ]
-    return round(sum(scores) / len(scores), 2) if scores else 0.0
+    column = f"{key}.score"
+    if column not in filtered:
+        return 0.0
+    mean = pd.to_numeric(filtered[column], errors="coerce").mean()
+    return 0.0 if pd.isna(mean) else round(float(mean), 2)
 
 # === CALCULATE METRICS ===
 naive_recall = calculate_avg(naive_filtered, 'context_recall')
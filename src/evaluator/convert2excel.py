@@ -1,7 +1,12 @@
-import json
+import os
+import sys
 import pandas as pd
 from pathlib import Path
 
+# Shared helpers live under src/; make them importable when this file is run as a script
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.json_io import load_json_stream
+
 # Input files
 BASE_DIR = Path("data/eval_results/")
 OPTIMIZE_PATH = BASE_DIR / "optimize_evaluations.json"
@@ -11,27 +16,25 @@ OUTPUT_EXCEL = BASE_DIR / "eval_comparison.xlsx"
 # Load JSON data
 def load_json(path):
     with open(path, encoding="utf-8") as f:
-        return json.load(f)
+        return load_json_stream(f)
 
 # Flatten results
-def flatten_results(data: dict, pipeline: str):
-    flat = []
-    for eval_type, entries in data.items():
-        for entry in entries:
-            flat.append({
-                "query": entry.get("query", "").strip(),
-                "evaluation_type": eval_type,
-                f"{pipeline}_score": entry.get("score"),
-                f"{pipeline}_missing_info": entry.get("missing_info"),
-                f"{pipeline}_noise": entry.get("noise"),
-                f"{pipeline}_percent_matched": entry.get("percent_matched"),
-            })
-    return flat
+METRIC_COLUMNS = ["score", "missing_info", "noise", "percent_matched"]
+
+def flatten_results(data: dict, pipeline: str) -> pd.DataFrame:
+    df = pd.json_normalize([
+        {**entry, "evaluation_type": eval_type}
+        for eval_type, entries in data.items()
+        for entry in entries
+    ])
+    df = df.reindex(columns=["query", "evaluation_type", *METRIC_COLUMNS])
+    df["query"] = df["query"].fillna("").astype(str).str.strip()
+    return df.rename(columns={col: f"{pipeline}_{col}" for col in METRIC_COLUMNS})
 
 # Merge both pipelines side-by-side
 def merge_results(optimize_data, naive_data):
-    df_opt = pd.DataFrame(flatten_results(optimize_data, "optimize"))
-    df_naive = pd.DataFrame(flatten_results(naive_data, "naive"))
+    df_opt = flatten_results(optimize_data, "optimize")
+    df_naive = flatten_results(naive_data, "naive")
 
     merged = pd.merge(df_opt, df_naive, on=["query", "evaluation_type"], how="outer")
     return merged
@@ -1,19 +1,47 @@
 import os
+import sys
 import json
 import asyncio
 from pathlib import Path
 from dotenv import load_dotenv
-import httpx
 from typing import List, Dict
 import argparse
+
+# Shared helpers live under src/; make them importable when this file is run as a script
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.json_io import loads, load_json, load_json_stream, dump_json_stream, load_query_log
+from evaluator.llm_client import (
+    AZURE_OPENAI_DEPLOYMENTS,
+    JSON_ONLY_REMINDER,
+    LLM_CACHE_ENABLED,
+    aclose,
+    chat_completions_url,
+    extract_json_object,
+    get_cached_response,
+    get_http_client,
+    llm_cache_key,
+    next_deployment,
+    parse_llm_json,
+    request_headers,
+    set_cached_response,
+    with_retries,
+)
+from evaluator.semantic_cache import SemanticCache
+
+# libuv-backed event loop: lower per-task overhead once many requests are in flight (Linux/macOS only)
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 # Load env
 load_dotenv()
 
-AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
-AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
-AZURE_OPENAI_DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT")
-AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2024-08-01-preview")
-
 # Input files
 GOLDEN_ANSWER_FILE = Path("data/golden_answers_compiled.json")
 NAIVE_LOGS_FILE = Path("compare/query_logs/naiveRag_query_logs.json")
@@ -23,45 +51,175 @@ OPTIMIZE_LOGS_FILE = Path("compare/query_logs/optimizeRag_query_logs.json")
 OUTPUT_DIR = Path("data/eval_results/")
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-# Load logs
-def load_json(path):
-    with open(path, encoding="utf-8") as f:
-        return json.load(f)
-
+# Concurrency
+MAX_CONCURRENT_QUERIES = int(os.getenv("EVAL_MAX_CONCURRENCY", "16"))
+
+# Stream completions and stop reading as soon as a complete JSON object has arrived. Opt-in: closing
+# the stream early also drops that keep-alive connection, which only pays off under slow tail latency.
+STREAM_RESPONSES = os.getenv("EVAL_STREAM_RESPONSES", "0") == "1"
+
+# Replies are fixed-shape JSON objects: ask Azure for JSON mode and cap the completion length (the
+# combined prompt returns three objects, so it gets three times the budget). missing_info and noise
+# list candidate names, so broad queries need the room; a reply cut off at the cap is retried once
+# with double the budget and otherwise recorded as an error, never as a result.
+JSON_MODE = os.getenv("EVAL_JSON_MODE", "1") != "0"
+EVAL_MAX_TOKENS = int(os.getenv("EVAL_MAX_TOKENS", 1024))
+
+# With separate prompts, send each query's material as an identical leading block and the check's
+# rubric after it, so the three requests share a cacheable prefix
+SHARED_PREFIX_EVALS = os.getenv("EVAL_SHARED_PREFIX", "1") != "0"
+
+# One Azure call per query returning all three evaluations; set to 0 to fall back to three separate prompts
+COMBINED_EVAL_PROMPT = os.getenv("EVAL_COMBINED_PROMPT", "1") != "0"
+
+# Semantic cache: reuse a response when a new answer embeds within SEMANTIC_CACHE_THRESHOLD cosine
+# of a cached one for the same check, golden answer and context. Only the generated answer is embedded;
+# everything else is hashed into the namespace, since every prompt opens with the long golden block and
+# MiniLM truncates at 256 tokens. Context recall has no answer to embed and uses the exact cache only.
+# Opt-in, since near-identical answers can still differ in a single name.
+SEMANTIC_CACHE_ENABLED = os.getenv("EVAL_SEMANTIC_CACHE", "0") == "1"
+SEMANTIC_CACHE_PATH = Path(os.getenv("EVAL_SEMANTIC_CACHE_PATH", "data/.sem_cache/eval_cache.pkl"))
+SEMANTIC_CACHE_MODEL = os.getenv("EVAL_SEMANTIC_CACHE_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("EVAL_SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_BATCH_SIZE = int(os.getenv("EVAL_SEMANTIC_CACHE_BATCH_SIZE", "256"))
+
+_semantic_cache = None
+
+def get_semantic_cache():
+    global _semantic_cache
+    if _semantic_cache is None:
+        _semantic_cache = SemanticCache(SEMANTIC_CACHE_PATH, SEMANTIC_CACHE_MODEL, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_BATCH_SIZE)
+    return _semantic_cache
+
+def make_semantic_key(kind, answer, *exact):
+    return SemanticCache.namespace(kind, *exact), answer
+
+# Golden answers, optionally restricted to `queries`; streamed pair-by-pair with ijson when installed,
+# so entries for queries that aren't being evaluated are never kept in memory
+def load_golden_answers(path, queries=None):
+    if ijson is None:
+        golden = load_json(path)
+        return golden if queries is None else {k: v for k, v in golden.items() if k in queries}
+    with open(path, "rb") as f:
+        return {k: v for k, v in ijson.kvitems(f, "", use_float=True) if queries is None or k in queries}
+
+class TruncatedReply(Exception):
+    """Azure stopped at max_tokens (finish_reason "length"), so the JSON is incomplete."""
+
+async def fetch_completion(url: str, headers: dict, body: dict) -> str:
+    if not STREAM_RESPONSES:
+        r = await get_http_client().post(url, headers=headers, json=body)
+        r.raise_for_status()
+        choice = r.json()["choices"][0]
+        if choice.get("finish_reason") == "length":
+            raise TruncatedReply(f"reply cut off at max_tokens={body['max_tokens']}")
+        return choice["message"]["content"]
+
+    parts = []
+    finish_reason = None
+    async with get_http_client().stream("POST", url, headers=headers, json={**body, "stream": True}) as r:
+        r.raise_for_status()
+        async for line in r.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            choices = loads(data).get("choices") or []
+            if choices:
+                finish_reason = choices[0].get("finish_reason") or finish_reason
+            piece = (choices[0].get("delta") or {}).get("content") if choices else None
+            if not piece:
+                continue
+            parts.append(piece)
+            if "}" in piece:
+                # Early exit once the reply holds a complete, parseable object
+                candidate = extract_json_object("".join(parts))
+                if candidate.endswith("}"):
+                    try:
+                        loads(candidate)
+                        return candidate
+                    except ValueError:
+                        pass
+    if finish_reason == "length":
+        raise TruncatedReply(f"reply cut off at max_tokens={body['max_tokens']}")
+    return "".join(parts)
 
 # Azure LLM call
-async def call_azure_llm(prompt: str) -> str:
-    headers = {
-        "Content-Type": "application/json",
-        "api-key": AZURE_OPENAI_API_KEY,
-    }
+_inflight_requests = {}
+
+async def call_azure_llm(prompt: str, system_prompt: str = "You are a helpful evaluation assistant.", max_tokens: int = EVAL_MAX_TOKENS, rubric: str = None, semantic_key=None) -> str:
+    headers = request_headers()
     body = {
         "messages": [
-            {"role": "system", "content": "You are a helpful evaluation assistant."},
+            {"role": "system", "content": system_prompt},
             {"role": "user", "content": prompt}
         ],
         "temperature": 0.2,
-        "max_tokens": 1024,
+        "max_tokens": max_tokens,
     }
-    url = f"{AZURE_OPENAI_ENDPOINT}/openai/deployments/{AZURE_OPENAI_DEPLOYMENT}/chat/completions?api-version={AZURE_OPENAI_API_VERSION}"
-    async with httpx.AsyncClient(timeout=60) as client:
-        r = await client.post(url, headers=headers, json=body)
-        r.raise_for_status()
-        return r.json()["choices"][0]["message"]["content"]
+    if rubric:
+        # Sent after the per-query material so requests that differ only in the check share their prefix
+        body["messages"].append({"role": "user", "content": rubric})
+    if JSON_MODE:
+        body["response_format"] = {"type": "json_object"}
+    request_key = llm_cache_key(body)
+    cache_key = request_key if LLM_CACHE_ENABLED else None
+    if cache_key:
+        cached = get_cached_response(cache_key)
+        if cached is not None:
+            return cached
+
+    # Identical prompts already in flight (e.g. both pipelines produced the same answer) share one request
+    task = _inflight_requests.get(request_key)
+    if task is None:
+        task = asyncio.ensure_future(request_completion(semantic_key, headers, body, cache_key))
+        _inflight_requests[request_key] = task
+        task.add_done_callback(lambda _: _inflight_requests.pop(request_key, None))
+    return await asyncio.shield(task)
+
+async def request_completion(semantic_key, headers: dict, body: dict, cache_key) -> str:
+    answer_vector = None
+    if SEMANTIC_CACHE_ENABLED and semantic_key:
+        namespace, answer = semantic_key
+        semantic_cache = get_semantic_cache()
+        answer_vector = await asyncio.to_thread(semantic_cache.embed, answer)
+        cached = semantic_cache.lookup(answer_vector, namespace)
+        if cached is not None:
+            return cached
+
+    # Each attempt goes to the next deployment, so a throttled one is not hit again straight away
+    async def complete(body):
+        return await with_retries(
+            lambda attempt: fetch_completion(chat_completions_url(next_deployment()), headers, body),
+            deployments=len(AZURE_OPENAI_DEPLOYMENTS),
+        )
+
+    try:
+        content = await complete(body)
+    except TruncatedReply:
+        content = await complete({**body, "max_tokens": 2 * body["max_tokens"]})
+    # Only replies that parse are kept; a truncated or prose reply is asked again on the next run
+    try:
+        parse_llm_json(content)
+    except ValueError:
+        return content
+    if cache_key:
+        set_cached_response(cache_key, content)
+    if answer_vector is not None:
+        semantic_cache.add(answer_vector, content, namespace)
+    return content
 
 # Prompt templates
-def make_faithfulness_prompt(golden: str, generated: str) -> str:
-    return f"""
+# The invariant rubric for each check goes in the system message and the per-query material in the
+# user message, so every request of a kind starts with the same byte-identical prefix that Azure's
+# prompt cache can reuse. With EVAL_SHARED_PREFIX the rubric is sent after the material instead, so the
+# three checks of one query share the (much longer) golden/answer/context prefix.
+FAITHFULNESS_SYSTEM_PROMPT = """
 You are an AI evaluator checking the faithfulness of a generated RAG answer against a golden reference answer.
 
 The goal is to verify whether the generated answer correctly includes the people listed in the golden answer. You do **not** need to verify the details *about* the people — only whether the **correct names** are included or omitted.
 
-Golden Answer (reference list of people):
-\"\"\"{golden}\"\"\"
-
-Generated Answer:
-\"\"\"{generated}\"\"\"
-
 Instructions:
 - Judge whether the expected people are mentioned.
 - Do NOT penalize the answer for summarizing or changing the format of the information.
@@ -78,27 +236,19 @@ If any names appear in the answer, they must be treated as hallucinations and th
 
 Return only a valid JSON with this format:
 
-{{
+{
   "score": <integer between 0-10>,
   "missing_info": "<comma-separated missing names or 'N/A'>",
   "noise": "<hallucinated names or 'N/A'>",
   "percent_matched": "<X% of expected names mentioned>"
-}}
+}
 """
 
-
-def make_context_recall_prompt(golden: str, context: str) -> str:
-    return f"""
+CONTEXT_RECALL_SYSTEM_PROMPT = """
 You are evaluating if the golden answer is properly supported by the retrieved context chunks.
 
 The focus is on whether the context contains enough evidence to support the people listed in the golden answer — even if the exact sentence or structure differs.
 
-Golden Answer (expected people):
-\"\"\"{golden}\"\"\"
-
-Retrieved Context:
-\"\"\"{context}\"\"\"
-
 Instructions:
 - Your job is NOT to judge the final answer — only whether this context could have helped an LLM get the correct people.
 - Identify any expected people missing from the context.
@@ -112,33 +262,21 @@ Instructions:
 
 Return only a valid JSON with this format:
 
-{{
+{
   "score": <integer between 0-10>,
   "missing_info": "<comma-separated missing names or 'N/A'>",
   "percent_matched": "<X% of golden names found in context>"
-}}
+}
 """
 
-
-
-def make_resume_mention_prompt(golden_entries, answer_text):
-    expected_names = [entry["resume"] for entry in golden_entries]
-    names_list = "\n".join(f"- {name}" for name in expected_names)
-    return f"""
+RESUME_MENTION_SYSTEM_PROMPT = """
 You are verifying whether the correct resume names were mentioned in a generated answer.
 
-Expected Resume Names (from golden answer):
-\"\"\"{names_list}\"\"\"
-
-Generated Answer:
-\"\"\"{answer_text}\"\"\"
-
 Instructions:
 - Check if the expected names or people are mentioned in the answer.
 - Do NOT be strict on name formatting (e.g., "Neha Resume.pdf" → "Neha" is fine).
 - If some are missing, list them.
 - If the answer mentions people who were not in the golden list, flag them as hallucinated.
-- Do NOT be strict on name formatting (e.g., "Neha Resume.pdf" → "Neha" is fine).
 - Score from 0 to 10 based on how many expected names were retrieved.
 - Special Case: If the list of expected resumes is empty, it means no resumes should be mentioned in the answer.
 If any names appear in the answer, they must be treated as hallucinations and the score should be 0.
@@ -150,28 +288,166 @@ If any names appear in the answer, they must be treated as hallucinations and th
 
 Return only a valid JSON with this format:
 
-{{
+{
   "score": <integer between 0-10>,
   "missing_info": "<comma-separated missing names or 'N/A'>",
   "noise": "<hallucinated names or 'N/A'>",
   "percent_matched": "<X% of expected resumes mentioned>"
-}}
+}
+"""
+
+COMBINED_EVAL_SYSTEM_PROMPT = """
+You are an AI evaluator for a resume RAG system. Run three independent checks on the material you are given and report all of them in one JSON object.
+
+Checks:
+1. "faithfulness": does the generated answer include the people listed in the golden answer? Do not verify details about the people, only whether the correct names are included or omitted. Extra names not in the golden answer are hallucinations (noise).
+2. "context_recall": does the retrieved context contain enough evidence to support the people in the golden answer, even if wording or structure differs? Judge the context only, not the final answer.
+3. "resume_mention": are the expected resume names mentioned in the generated answer? Do NOT be strict on name formatting (e.g., "Neha Resume.pdf" → "Neha" is fine). Names not in the expected list are hallucinations (noise).
+
+Rules for every check:
+- Ignore formatting, summarizing and paraphrasing.
+- Give a score between 0 and 10 based on match coverage: 0 = 0% of expected names, 5 = ~50%, 10 = all or nearly all.
+- Special Case: If the list of expected resumes is empty, no resumes should be mentioned in the answer. For "faithfulness" and "resume_mention", any names that appear must be treated as hallucinations and the score should be 0.
+
+Return only a valid JSON with this format:
+
+{
+  "faithfulness": {
+    "score": <integer between 0-10>,
+    "missing_info": "<comma-separated missing names or 'N/A'>",
+    "noise": "<hallucinated names or 'N/A'>",
+    "percent_matched": "<X% of expected names mentioned>"
+  },
+  "context_recall": {
+    "score": <integer between 0-10>,
+    "missing_info": "<comma-separated missing names or 'N/A'>",
+    "percent_matched": "<X% of golden names found in context>"
+  },
+  "resume_mention": {
+    "score": <integer between 0-10>,
+    "missing_info": "<comma-separated missing names or 'N/A'>",
+    "noise": "<hallucinated names or 'N/A'>",
+    "percent_matched": "<X% of expected resumes mentioned>"
+  }
+}
+"""
+
+SHARED_EVAL_SYSTEM_PROMPT = """
+You are an AI evaluator for a resume RAG system. You are given the material for one query, followed by the single check to run on it.
+"""
+
+def format_golden(golden_entries):
+    """Render a query's golden entries once; every prompt for that query reuses these strings."""
+    names_list = "\n".join(f"- {entry['resume']}" for entry in golden_entries)
+    return str(golden_entries), names_list
+
+def make_faithfulness_prompt(golden: str, generated: str) -> str:
+    return f"""
+Golden Answer (reference list of people):
+\"\"\"{golden}\"\"\"
+
+Generated Answer:
+\"\"\"{generated}\"\"\"
 """
 
+
+def make_context_recall_prompt(golden: str, context: str) -> str:
+    return f"""
+Golden Answer (expected people):
+\"\"\"{golden}\"\"\"
+
+Retrieved Context:
+\"\"\"{context}\"\"\"
+"""
+
+
+
+def make_resume_mention_prompt(names_list: str, answer_text: str) -> str:
+    return f"""
+Expected Resume Names (from golden answer):
+\"\"\"{names_list}\"\"\"
+
+Generated Answer:
+\"\"\"{answer_text}\"\"\"
+"""
+
+def make_combined_eval_prompt(golden: str, names_list: str, generated: str, context: str) -> str:
+    return f"""
+Golden Answer (reference list of people):
+\"\"\"{golden}\"\"\"
+
+Expected Resume Names (from golden answer):
+\"\"\"{names_list}\"\"\"
+
+Generated Answer:
+\"\"\"{generated}\"\"\"
+
+Retrieved Context:
+\"\"\"{context}\"\"\"
+"""
+
+# All three evals in a single round-trip
+async def run_combined_evals(query, golden_text, names_list, log_entry):
+    print(f"🔎 Running combined evaluation for query: {query[:60]}...")
+    prompt = make_combined_eval_prompt(golden_text, names_list, log_entry["response"], log_entry["context"])
+    key = make_semantic_key("combined", log_entry["response"], golden_text, names_list, log_entry["context"])
+    try:
+        llm_raw = await call_azure_llm(prompt, COMBINED_EVAL_SYSTEM_PROMPT, 3 * EVAL_MAX_TOKENS, semantic_key=key)
+    except Exception as e:
+        error = {"query": query, "llm_response": f"Error: {str(e)}"}
+        return dict(error), dict(error), dict(error)
+
+    try:
+        parsed = parse_llm_json(llm_raw)
+    except ValueError:
+        # One retry with a stricter instruction beats re-running the whole query next time
+        try:
+            llm_raw = await call_azure_llm(prompt + JSON_ONLY_REMINDER, COMBINED_EVAL_SYSTEM_PROMPT, 3 * EVAL_MAX_TOKENS)
+            parsed = parse_llm_json(llm_raw)
+        except Exception as e:
+            print(f"⚠️ Error parsing combined evaluation response for '{query[:40]}': {e}")
+            parsed = {}
+
+    def split(key, fields):
+        section = parsed.get(key) if isinstance(parsed, dict) else None
+        if not isinstance(section, dict):
+            # Stored as an error so the query is picked up again on the next run
+            return {"query": query, "llm_response": f"Error: no '{key}' section in combined response: {llm_raw}"}
+        result = {"query": query, "llm_response": json.dumps(section, ensure_ascii=False)}
+        result.update({field: section.get(field) for field in fields})
+        return result
+
+    return (
+        split("faithfulness", ("score", "missing_info", "noise", "percent_matched")),
+        split("context_recall", ("score", "missing_info", "percent_matched")),
+        split("resume_mention", ("score", "missing_info", "noise", "percent_matched")),
+    )
+
 # Per-query all evals in parallel
 async def run_all_evals(query, golden_entry, log_entry):
+    golden_text, names_list = format_golden(golden_entry)
+    if COMBINED_EVAL_PROMPT:
+        return await run_combined_evals(query, golden_text, names_list, log_entry)
+
     answer = log_entry["response"]
     context = log_entry["context"]
 
     print(f"🔎 Running 3 evaluations for query: {query[:60]}...")
 
+    shared = make_combined_eval_prompt(golden_text, names_list, answer, context) if SHARED_PREFIX_EVALS else None
+
+    async def ask(prompt, rubric, key=None):
+        if shared is None:
+            return await call_azure_llm(prompt, rubric, semantic_key=key)
+        return await call_azure_llm(shared, SHARED_EVAL_SYSTEM_PROMPT, rubric=rubric, semantic_key=key)
+
     async def faithfulness():
-        prompt = make_faithfulness_prompt(golden_entry, answer)
+        prompt = make_faithfulness_prompt(golden_text, answer)
         try:
             print("🔍 [FAITHFULNESS]")
-            llm_raw = await call_azure_llm(prompt)
+            llm_raw = await ask(prompt, FAITHFULNESS_SYSTEM_PROMPT, make_semantic_key("faithfulness", answer, golden_text))
             try:
-                parsed = json.loads(llm_raw)
+                parsed = parse_llm_json(llm_raw)
             except Exception as e:
                 print(f"⚠️ Error parsing faithfulness response for '{query[:40]}': {e}")
                 parsed = {}
@@ -188,12 +464,12 @@ async def run_all_evals(query, golden_entry, log_entry):
             return {"query": query, "llm_response": f"Error: {str(e)}"}
 
     async def context_recall():
-        prompt = make_context_recall_prompt(golden_entry, context)
+        prompt = make_context_recall_prompt(golden_text, context)
         try:
             print("🔍 [CONTEXT]")
-            llm_raw = await call_azure_llm(prompt)
+            llm_raw = await ask(prompt, CONTEXT_RECALL_SYSTEM_PROMPT)
             try:
-                parsed = json.loads(llm_raw)
+                parsed = parse_llm_json(llm_raw)
             except Exception as e:
                 print(f"⚠️ Error parsing context recall response for '{query[:40]}': {e}")
                 parsed = {}
@@ -209,12 +485,12 @@ async def run_all_evals(query, golden_entry, log_entry):
             return {"query": query, "llm_response": f"Error: {str(e)}"}
 
     async def resume_mention():
-        prompt = make_resume_mention_prompt(golden_entry, answer)
+        prompt = make_resume_mention_prompt(names_list, answer)
         try:
             print("🔍 [RESUME NAMES]")
-            llm_raw = await call_azure_llm(prompt)
+            llm_raw = await ask(prompt, RESUME_MENTION_SYSTEM_PROMPT, make_semantic_key("resume_mention", answer, names_list))
             try:
-                parsed = json.loads(llm_raw)
+                parsed = parse_llm_json(llm_raw)
             except Exception as e:
                 print(f"⚠️ Error parsing resume mention response for '{query[:40]}': {e}")
                 parsed = {}
@@ -230,46 +506,105 @@ async def run_all_evals(query, golden_entry, log_entry):
         except Exception as e:
             return {"query": query, "llm_response": f"Error: {str(e)}"}
 
-    return await asyncio.gather(faithfulness(), context_recall(), resume_mention())
+    # All three requests go out back-to-back on the shared client
+    async with asyncio.TaskGroup() as tg:
+        faith_task = tg.create_task(faithfulness())
+        ctx_task = tg.create_task(context_recall())
+        resume_task = tg.create_task(resume_mention())
+    return faith_task.result(), ctx_task.result(), resume_task.result()
 
 # Run pipeline
 async def evaluate_pipeline(name: str, logs: List[Dict], golden_answers: Dict):
     print(f"\n🚀 Starting evaluation for: {name.upper()} | Total queries: {len(logs)}\n")
 
     output_file = OUTPUT_DIR / f"{name}_evaluations.json"
+    # One line per finished query; folded into output_file at the end of the run
+    journal_file = OUTPUT_DIR / f"{name}_evaluations.jsonl"
 
     # Initialize maps to avoid duplicates and allow overriding
     faithfulness_map = {}
     context_map = {}
     resume_map = {}
 
-    already_evaluated = set()
-
     # Load existing results if available
     if output_file.exists():
         print(f"🔁 Loading previously saved results from {output_file}")
         with open(output_file, "r", encoding="utf-8") as f:
-            previous = json.load(f)
+            previous = load_json_stream(f)
 
         faithfulness_map = {entry["query"]: entry for entry in previous.get("faithfulness", [])}
         context_map = {entry["query"]: entry for entry in previous.get("context", [])}
         resume_map = {entry["query"]: entry for entry in previous.get("resume", [])}
 
-        # Mark queries as fully evaluated only if all 3 are valid
-        for q in faithfulness_map:
-            f = faithfulness_map.get(q)
-            c = context_map.get(q)
-            r = resume_map.get(q)
-            if (
-                f and isinstance(f.get("llm_response"), str) and not f["llm_response"].startswith("Error:")
-                and c and isinstance(c.get("llm_response"), str) and not c["llm_response"].startswith("Error:")
-                and r and isinstance(r.get("llm_response"), str) and not r["llm_response"].startswith("Error:")
-            ):
-                already_evaluated.add(q)
+    # Replay queries finished by an interrupted run
+    if journal_file.exists():
+        print(f"🔁 Replaying journaled results from {journal_file}")
+        with open(journal_file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = loads(line)
+                except ValueError:
+                    continue  # torn last line
+                faithfulness_map[row["query"]] = row["faithfulness"]
+                context_map[row["query"]] = row["context"]
+                resume_map[row["query"]] = row["resume"]
+
+    def is_valid(entry):
+        response = entry.get("llm_response") if entry else None
+        return isinstance(response, str) and not response.startswith("Error:")
+
+    # Mark queries as fully evaluated only if all 3 are valid
+    already_evaluated = {
+        q for q, f in faithfulness_map.items()
+        if is_valid(f) and is_valid(context_map.get(q)) and is_valid(resume_map.get(q))
+    }
 
+    # First run with the semantic cache: seed it from answers whose evaluations are already on disk
+    if SEMANTIC_CACHE_ENABLED and already_evaluated and not get_semantic_cache().responses:
+        log_map = {log_entry["query"]: log_entry for log_entry in logs}
+        answers, responses, namespaces = [], [], []
+        for q in already_evaluated:
+            log_entry, golden_entry = log_map.get(q), golden_answers.get(q)
+            if log_entry is None or golden_entry is None:
+                continue
+            golden_text, names_list = format_golden(golden_entry)
+            answer = log_entry["response"]
+            if COMBINED_EVAL_PROMPT:
+                try:
+                    sections = [loads(entry[q]["llm_response"]) for entry in (faithfulness_map, context_map, resume_map)]
+                except ValueError:
+                    continue
+                keys = [make_semantic_key("combined", answer, golden_text, names_list, log_entry["context"])]
+                stored = [json.dumps(dict(zip(("faithfulness", "context_recall", "resume_mention"), sections)), ensure_ascii=False)]
+            else:
+                keys = [make_semantic_key("faithfulness", answer, golden_text), make_semantic_key("resume_mention", answer, names_list)]
+                stored = [faithfulness_map[q]["llm_response"], resume_map[q]["llm_response"]]
+            for (namespace, text), response in zip(keys, stored):
+                answers.append(text)
+                responses.append(response)
+                namespaces.append(namespace)
+        await asyncio.to_thread(get_semantic_cache().warm, answers, responses, namespaces)
+
+    def save_results():
+        all_results = {
+            "faithfulness": list(faithfulness_map.values()),
+            "context": list(context_map.values()),
+            "resume": list(resume_map.values()),
+        }
+        # Write-then-rename so a crash mid-write never leaves a truncated checkpoint behind
+        tmp_file = output_file.with_suffix(".json.tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            dump_json_stream(all_results, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, output_file)
+
+    # Collect queries to evaluate; a repeated query keeps its last log entry
+    pending = {}
+    golden_keys = frozenset(golden_answers)
     for idx, log_entry in enumerate(logs, 1):
         query = log_entry["query"]
-        if query not in golden_answers:
+        if query not in golden_keys:
             print(f"⚠️  Skipping query not in golden set: '{query[:60]}...'")
             continue
 
@@ -277,43 +612,70 @@ async def evaluate_pipeline(name: str, logs: List[Dict], golden_answers: Dict):
             print(f"⏩ Skipping previously evaluated query: '{query[:60]}...'")
             continue
 
-        print(f"\n🔹 [{idx}/{len(logs)}] Query:\n{query[:80]}...\n")
-        golden_entry = golden_answers[query]
+        pending[query] = (idx, log_entry)
+
+    sem = asyncio.Semaphore(MAX_CONCURRENT_QUERIES)
 
-        faith, ctx, resume = await run_all_evals(query, golden_entry, log_entry)
+    async def evaluate_one(query, idx, log_entry):
+        async with sem:
+            print(f"\n🔹 [{idx}/{len(logs)}] Query:\n{query[:80]}...\n")
+            golden_entry = golden_answers[query]
+            faith, ctx, resume = await run_all_evals(query, golden_entry, log_entry)
 
         # Overwrite or add new entries
         faithfulness_map[query] = faith
         context_map[query] = ctx
         resume_map[query] = resume
 
-        # Save incrementally
-        all_results = {
-            "faithfulness": list(faithfulness_map.values()),
-            "context": list(context_map.values()),
-            "resume": list(resume_map.values()),
-        }
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(all_results, f, indent=2, ensure_ascii=False)
+        # Append just this query instead of rewriting the whole results file
+        journal.write(json.dumps({"query": query, "faithfulness": faith, "context": ctx, "resume": resume}, ensure_ascii=False) + "\n")
+        journal.flush()
+
+    with open(journal_file, "a", encoding="utf-8") as journal:
+        results = await asyncio.gather(
+            *(evaluate_one(query, idx, log_entry) for query, (idx, log_entry) in pending.items()),
+            return_exceptions=True
+        )
+    for query, result in zip(pending, results):
+        if isinstance(result, Exception):
+            print(f"⚠️ Evaluation failed for '{query[:60]}': {result}")
+
+    # Final save in log order (incremental saves follow completion order)
+    order = {log_entry["query"]: i for i, log_entry in enumerate(logs)}
+    for results_map in (faithfulness_map, context_map, resume_map):
+        ordered = sorted(results_map.items(), key=lambda kv: order.get(kv[0], len(order)))
+        results_map.clear()
+        results_map.update(ordered)
+    save_results()
+    journal_file.unlink(missing_ok=True)
 
     print(f"\n✅ Saved evaluation results for {name.upper()} to: {output_file}\n")
 
 # MAIN
 async def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--pipeline", required=True, choices=["naive", "optimize"], help="Pipeline to evaluate")
+    parser.add_argument("--pipeline", required=True, choices=["naive", "optimize", "both"], help="Pipeline to evaluate")
     args = parser.parse_args()
 
     print("📥 Loading input files...")
-    golden = load_json(GOLDEN_ANSWER_FILE)
-    golden_map = {k: v for k, v in golden.items()}
-    naive_logs = load_json(NAIVE_LOGS_FILE)
-    optimize_logs = load_json(OPTIMIZE_LOGS_FILE)
-
-    if args.pipeline == "naive":
-        await evaluate_pipeline("naive", naive_logs, golden_map)
-    elif args.pipeline == "optimize":
-        await evaluate_pipeline("optimize", optimize_logs, golden_map)
+    # Only read the logs for the pipelines being evaluated
+    log_files = {"naive": NAIVE_LOGS_FILE, "optimize": OPTIMIZE_LOGS_FILE}
+    names = list(log_files) if args.pipeline == "both" else [args.pipeline]
+    logs_by_name = {name: load_query_log(log_files[name]) for name in names}
+    golden_map = load_golden_answers(
+        GOLDEN_ANSWER_FILE, {e["query"] for logs in logs_by_name.values() for e in logs}
+    )
+
+    try:
+        # With "both", prompts the two pipelines have in common are sent once and the result is shared
+        await asyncio.gather(*(evaluate_pipeline(name, logs, golden_map) for name, logs in logs_by_name.items()))
+    finally:
+        await aclose()
+        if _semantic_cache is not None:
+            _semantic_cache.save()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
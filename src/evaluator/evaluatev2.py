@@ -1,19 +1,47 @@
 import os
+import sys
+import re
 import json
 import asyncio
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
 import httpx
 import argparse
 
+# Shared helpers live under src/; make them importable when this file is run as a script
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.json_io import loads, load_json, load_json_stream, dump_json_stream, load_query_log
+from evaluator.llm_client import (
+    AZURE_OPENAI_API_KEY,
+    AZURE_OPENAI_DEPLOYMENT,
+    AZURE_OPENAI_ENDPOINT,
+    LLM_CACHE_ENABLED,
+    aclose,
+    chat_completions_url,
+    get_cached_response,
+    get_http_client,
+    llm_cache_key,
+    request_headers,
+    set_cached_response,
+    with_retries,
+)
+from evaluator.semantic_cache import SemanticCache
+
+# libuv-backed event loop: lower per-task overhead once many requests are in flight (Linux/macOS only)
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 # Load environment variables
 load_dotenv()
 
-AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
-AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
-AZURE_OPENAI_DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT")
-AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2024-08-01-preview")
-
 # Input files
 GOLDEN_ANSWER_FILE = Path("data/golden_answers_compiled.json")
 NAIVE_LOGS_FILE = Path("compare/query_logs/naiveRag_query_logs.json")
@@ -23,41 +51,291 @@ OPTIMIZE_LOGS_FILE = Path("compare/query_logs/optimizeRag_query_logs.json")
 OUTPUT_DIR = Path(__file__).parent.parent.parent / "data" / "eval_results"
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-# Load json from file
-def load_json(path):
-    with open(path, encoding="utf-8") as f:
-        return json.load(f)
+# Queries evaluated concurrently; keep at or below the client's max_connections to avoid pool timeouts
+MAX_CONCURRENT_QUERIES = int(os.getenv("EVAL_MAX_CONCURRENCY", "16"))
+
+# Per-request read timeout scaled to prompt size: hung small requests are cut early, large ones get
+# longer, and each retry after a timeout doubles it (up to the cap)
+MIN_REQUEST_TIMEOUT = 15
+MAX_REQUEST_TIMEOUT = 120
+
+def request_timeout(prompt: str, timeouts: int) -> httpx.Timeout:
+    base = max(MIN_REQUEST_TIMEOUT, min(MAX_REQUEST_TIMEOUT, 10 + len(prompt) / 200))
+    return httpx.Timeout(min(MAX_REQUEST_TIMEOUT, base * 2 ** timeouts), connect=5.0)
+
+# Stream completions and stop reading as soon as a complete JSON object has arrived. Opt-in: closing
+# the stream early also drops that keep-alive connection, which only pays off under slow tail latency.
+STREAM_RESPONSES = os.getenv("EVAL_STREAM_RESPONSES", "0") == "1"
+
+# Ask Azure for JSON mode so replies are a bare object; set to 0 for API versions that reject it
+JSON_MODE = os.getenv("EVAL_JSON_MODE", "1") != "0"
+
+# Retrieval mode asks for context recall and precision in one Azure call; set to 0 for two separate prompts
+COMBINED_EVAL_PROMPT = os.getenv("EVAL_COMBINED_PROMPT", "1") != "0"
+
+# Trim the context sent with the separate recall prompt to paragraphs near a golden candidate name.
+# Opt-in and recall-only: precision judges how much of the *full* context is noise, so it (and the
+# combined prompt) always gets the context verbatim.
+COMPRESS_RECALL_CONTEXT = os.getenv("EVAL_COMPRESS_CONTEXT", "0") == "1"
+CONTEXT_WINDOW = int(os.getenv("EVAL_CONTEXT_WINDOW", "1"))
+CONTEXT_MAX_CHARS = int(os.getenv("EVAL_CONTEXT_MAX_CHARS", "4000"))
+NAME_STOPWORDS = {"resume", "pdf", "docx", "doc", "final", "updated"}
+
+# raw_response repeats the whole Azure reply next to the parsed score/reason; only kept when asked for
+KEEP_RAW_RESPONSES = os.getenv("EVAL_KEEP_RAW", "0") == "1"
+
+# Client-side pacing below the deployment's requests-per-minute quota, so bursts wait locally instead
+# of bouncing off 429s. EVAL_RPM=0 (default) disables it.
+EVAL_RPM = int(os.getenv("EVAL_RPM", "0"))
+EVAL_RPM_BURST = int(os.getenv("EVAL_RPM_BURST", "10"))
+
+class RateLimiter:
+    """Token bucket refilled at `rate_per_minute`, holding at most `burst` tokens."""
+
+    def __init__(self, rate_per_minute, burst):
+        self.interval = 60.0 / rate_per_minute
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = None
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if self.updated is not None:
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) / self.interval)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) * self.interval)
+
+rate_limiter = RateLimiter(EVAL_RPM, EVAL_RPM_BURST) if EVAL_RPM > 0 else None
+
+# Semantic cache: reuse a faithfulness verdict when the generated answer embeds within
+# SEMANTIC_CACHE_THRESHOLD cosine of one already judged against the same golden answer. Only the answer
+# is embedded (every v2 prompt opens with the long golden block, which alone would fill MiniLM's
+# 256-token window); the golden answer and prompt kind are matched exactly through the namespace.
+# Retrieval prompts depend only on golden answer and context, so they rely on the exact-match cache.
+# Opt-in and conservative: a false hit silently copies another answer's score.
+SEMANTIC_CACHE_ENABLED = os.getenv("EVAL_SEMANTIC_CACHE", "0") == "1"
+SEMANTIC_CACHE_PATH = Path(os.getenv("EVAL_V2_SEMANTIC_CACHE_PATH", "data/.sem_cache/eval_v2_cache.pkl"))
+SEMANTIC_CACHE_MODEL = os.getenv("EVAL_SEMANTIC_CACHE_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("EVAL_V2_SEMANTIC_CACHE_THRESHOLD", "0.97"))
+
+_semantic_cache = None
+
+def get_semantic_cache():
+    global _semantic_cache
+    if _semantic_cache is None:
+        _semantic_cache = SemanticCache(SEMANTIC_CACHE_PATH, SEMANTIC_CACHE_MODEL, SEMANTIC_CACHE_THRESHOLD)
+    return _semantic_cache
+
+# Golden answers, optionally restricted to `queries`; streamed pair-by-pair with ijson when installed,
+# so entries for queries that aren't being evaluated are never kept in memory
+def load_golden_answers(path, queries=None):
+    if ijson is None:
+        golden = load_json(path)
+        return golden if queries is None else {k: v for k, v in golden.items() if k in queries}
+    with open(path, "rb") as f:
+        return {k: v for k, v in ijson.kvitems(f, "", use_float=True) if queries is None or k in queries}
 
 # Azure LLM call (async)
-async def call_azure_llm(prompt: str) -> str:
-    headers = {
-        "Content-Type": "application/json",
-        "api-key": AZURE_OPENAI_API_KEY,
-    }
+def build_chat_body(prompt: str) -> dict:
     body = {
         "messages": [
-            {"role": "system", "content": "You are a helpful evaluation assistant."},
+            {"role": "system", "content": "You are a helpful evaluation assistant. Respond with a single JSON object."},
             {"role": "user", "content": prompt}
         ],
         "temperature": 0.2,
         "max_tokens": 1024,
     }
-    url = f"{AZURE_OPENAI_ENDPOINT}/openai/deployments/{AZURE_OPENAI_DEPLOYMENT}/chat/completions?api-version={AZURE_OPENAI_API_VERSION}"
-    async with httpx.AsyncClient(timeout=60) as client:
-        r = await client.post(url, headers=headers, json=body)
+    if JSON_MODE:
+        body["response_format"] = {"type": "json_object"}
+    return body
+
+async def fetch_completion(url: str, headers: dict, body: dict, timeout: httpx.Timeout) -> str:
+    if not STREAM_RESPONSES:
+        r = await get_http_client().post(url, headers=headers, json=body, timeout=timeout)
         r.raise_for_status()
         return r.json()["choices"][0]["message"]["content"]
 
-# Revised prompt for Context Recall with additional instructions on grounding
-def make_context_recall_prompt(golden: str, context: str) -> str:
+    parts = []
+    async with get_http_client().stream("POST", url, headers=headers, json={**body, "stream": True}, timeout=timeout) as r:
+        r.raise_for_status()
+        async for line in r.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            choices = loads(data).get("choices") or []
+            piece = (choices[0].get("delta") or {}).get("content") if choices else None
+            if not piece:
+                continue
+            parts.append(piece)
+            if "}" in piece:
+                # Early exit once the reply holds a complete, parseable object
+                candidate = extract_json_from_text("".join(parts))
+                if candidate:
+                    try:
+                        loads(candidate)
+                        return candidate
+                    except ValueError:
+                        pass  # a brace inside a string value, not the end of the object
+    return "".join(parts)
+
+async def call_azure_llm(prompt: str, semantic_key: tuple = None) -> str:
+    """`semantic_key` is an optional (namespace, text) pair for the semantic cache; see SemanticCache."""
+    headers = request_headers()
+    body = build_chat_body(prompt)
+    request_key = llm_cache_key(body)
+    if request_key in batch_responses:
+        return batch_responses[request_key]
+
+    cache_key = request_key if LLM_CACHE_ENABLED else None
+    if cache_key:
+        cached = get_cached_response(cache_key)
+        if cached is not None:
+            return cached
+
+    prompt_vector = None
+    if SEMANTIC_CACHE_ENABLED and semantic_key is not None:
+        semantic_namespace, semantic_text = semantic_key
+        semantic_cache = get_semantic_cache()
+        prompt_vector = await asyncio.to_thread(semantic_cache.embed, semantic_text)
+        cached = semantic_cache.lookup(prompt_vector, semantic_namespace)
+        if cached is not None:
+            return cached
+
+    url = chat_completions_url()
+    timeouts = 0
+
+    async def send(attempt):
+        nonlocal timeouts
+        if rate_limiter is not None:
+            await rate_limiter.acquire()
+        try:
+            return await fetch_completion(url, headers, body, request_timeout(prompt, timeouts))
+        except httpx.TimeoutException:
+            # Only a timed-out attempt widens the next one; 429/5xx retries keep the same budget
+            timeouts += 1
+            raise
+
+    content = await with_retries(send)
+    # Only judgments that parse are kept; a malformed one is asked again on the next run
+    if not is_parseable(content):
+        return content
+    if cache_key:
+        set_cached_response(cache_key, content)
+    if prompt_vector is not None:
+        semantic_cache.add(prompt_vector, content, semantic_namespace)
+    return content
+
+# Azure Batch API: the whole run's prompts go up as one JSONL job (half the price, separate quota) and
+# the replies are served to call_azure_llm from batch_responses, keyed like the exact-match cache.
+# Needs a Global Batch deployment; prompts the job doesn't answer fall back to live calls.
+AZURE_OPENAI_BATCH_DEPLOYMENT = os.getenv("AZURE_OPENAI_BATCH_DEPLOYMENT", AZURE_OPENAI_DEPLOYMENT)
+AZURE_OPENAI_BATCH_API_VERSION = os.getenv("AZURE_OPENAI_BATCH_API_VERSION", "2024-10-21")
+BATCH_POLL_INTERVAL = int(os.getenv("EVAL_BATCH_POLL_INTERVAL", "30"))
+BATCH_TERMINAL_STATUS = {"completed", "failed", "expired", "cancelled"}
+batch_responses = {}
+
+async def run_batch_job(prompts: list) -> dict:
+    headers = {"api-key": AZURE_OPENAI_API_KEY}
+    base_url = f"{AZURE_OPENAI_ENDPOINT}/openai"
+    params = {"api-version": AZURE_OPENAI_BATCH_API_VERSION}
+    client = get_http_client()
+
+    requests = {}
+    for prompt in prompts:
+        body = build_chat_body(prompt)
+        key = llm_cache_key(body)
+        if key in requests or (LLM_CACHE_ENABLED and get_cached_response(key) is not None):
+            continue
+        requests[key] = {"custom_id": key, "method": "POST", "url": "/chat/completions",
+                         "body": {**body, "model": AZURE_OPENAI_BATCH_DEPLOYMENT}}
+    if not requests:
+        return {}
+
+    print(f"📦 Submitting {len(requests)} prompts as an Azure batch job...")
+    jsonl = "\n".join(json.dumps(r, ensure_ascii=False) for r in requests.values()).encode("utf-8")
+    r = await client.post(f"{base_url}/files", params=params, headers=headers,
+                          data={"purpose": "batch"}, files={"file": ("eval_batch.jsonl", jsonl, "application/jsonl")})
+    r.raise_for_status()
+    r = await client.post(f"{base_url}/batches", params=params, headers=headers,
+                          json={"input_file_id": r.json()["id"], "endpoint": "/chat/completions", "completion_window": "24h"})
+    r.raise_for_status()
+    job = r.json()
+
+    while job["status"] not in BATCH_TERMINAL_STATUS:
+        await asyncio.sleep(BATCH_POLL_INTERVAL)
+        r = await client.get(f"{base_url}/batches/{job['id']}", params=params, headers=headers)
+        r.raise_for_status()
+        job = r.json()
+        counts = job.get("request_counts") or {}
+        print(f"⏳ Batch {job['id']}: {job['status']} ({counts.get('completed', 0)}/{counts.get('total', len(requests))})")
+
+    if not job.get("output_file_id"):
+        print(f"⚠️ Batch {job['id']} ended as '{job['status']}' with no output; falling back to live calls")
+        return {}
+
+    r = await client.get(f"{base_url}/files/{job['output_file_id']}/content", params=params, headers=headers)
+    r.raise_for_status()
+    responses = {}
+    for line in r.text.splitlines():
+        if not line.strip():
+            continue
+        row = loads(line)
+        response = row.get("response") or {}
+        if response.get("status_code") != 200:
+            continue
+        content = response["body"]["choices"][0]["message"]["content"]
+        responses[row["custom_id"]] = content
+        if LLM_CACHE_ENABLED and is_parseable(content):
+            set_cached_response(row["custom_id"], content)
+    print(f"✅ Batch {job['id']} returned {len(responses)}/{len(requests)} responses")
+    return responses
+
+def golden_name_tokens(golden_entry) -> frozenset:
+    if isinstance(golden_entry, list):
+        names = [entry.get("resume", "") for entry in golden_entry if isinstance(entry, dict)]
+    else:
+        names = [str(golden_entry)]
+    return frozenset(t.lower() for name in names for t in re.findall(r"[A-Za-z]{3,}", name)) - NAME_STOPWORDS
+
+# The same context recurs across reruns and the naive/optimize logs, so compress each pair once
+@lru_cache(maxsize=1024)
+def compress_context(context: str, name_tokens: frozenset) -> str:
+    if not name_tokens:
+        return context
+    paragraphs = list(dict.fromkeys(p for p in re.split(r"\n\s*\n", context) if p.strip()))
+    hits = [i for i, p in enumerate(paragraphs) if name_tokens & set(re.findall(r"[a-z]{3,}", p.lower()))]
+    keep = sorted({j for i in hits for j in range(i - CONTEXT_WINDOW, i + CONTEXT_WINDOW + 1) if 0 <= j < len(paragraphs)})
+    return "\n\n".join(paragraphs[j] for j in keep)[:CONTEXT_MAX_CHARS]
+
+def recall_context(golden_entry, context: str) -> str:
+    return compress_context(context, golden_name_tokens(golden_entry)) if COMPRESS_RECALL_CONTEXT else context
+
+# Every prompt opens with the same golden-answer block (and the recall/precision prompts with the same
+# context block after it); the task description comes last, so prompts for one query share a prefix
+# that Azure's prompt cache can reuse.
+def golden_block(golden: str) -> str:
     return f"""
-You are evaluating whether the retrieved context provides all the necessary supporting evidence for the expected candidate names as specified in the golden answer.
-
-Golden Answer (expected supporting evidence for candidates):
+Golden Answer (expected candidate names and supporting evidence):
 \"\"\"{golden}\"\"\"
+"""
 
+def context_block(golden: str, context: str) -> str:
+    return f"""{golden_block(golden)}
 Retrieved Context:
 \"\"\"{context}\"\"\"
+"""
+
+# Revised prompt for Context Recall with additional instructions on grounding
+def make_context_recall_prompt(golden: str, context: str) -> str:
+    return f"""{context_block(golden, context)}
+Task: evaluate whether the retrieved context above provides all the necessary supporting evidence for the expected candidate names as specified in the golden answer.
 
 Instructions:
 -Do NOT be strict on name formatting:
@@ -78,14 +356,8 @@ Return only a valid JSON object with exactly these keys:
 
 # Revised prompt for Context Precision (Updated to evaluate the same evidence as Recall, but with precision criteria)
 def make_context_precision_prompt(golden: str, context: str) -> str:
-    return f"""
-You are evaluating the relevance and focus of the retrieved context with respect to the supporting evidence expected for the candidate names as specified in the golden answer.
-
-Golden Answer (expected supporting evidence for candidates):
-\"\"\"{golden}\"\"\"
-
-Retrieved Context:
-\"\"\"{context}\"\"\"
+    return f"""{context_block(golden, context)}
+Task: evaluate the relevance and focus of the retrieved context above with respect to the supporting evidence expected for the candidate names as specified in the golden answer.
 
 Instructions:
 - Check if every expected candidate name is mentioned and, for each name, verify that there is sufficient supporting detail (e.g., role descriptions, achievements, metrics) that justifies its inclusion.
@@ -107,18 +379,43 @@ Return only a valid JSON object with exactly these keys:
 }}
 """
 
+# Context recall and precision over the same golden answer and context, judged in one completion
+def make_combined_retrieval_prompt(golden: str, context: str) -> str:
+    return f"""{context_block(golden, context)}
+Task: evaluate the retrieved context above against the supporting evidence expected for the candidate names as specified in the golden answer. Run two independent checks and report both in one JSON object.
 
-# New prompt for Faithfulness Evaluation
-def make_faithfulness_prompt(golden: str, generated: str) -> str:
-    return f"""
-You are evaluating the faithfulness of a generated answer against a golden reference answer that lists expected candidate names and supporting evidence.
+Rules for both checks:
+- Do NOT be strict on name formatting:
+    1. For example, if the candidate’s name appears as "Neha Resume.pdf" or "Neha-Resume.pdf", you should interpret it simply as "Neha" without penalizing the response for including file extensions or minor formatting differences.
+    2. In some cases, the candidate's name may appear in a cluttered or non-standard format and might be positioned above the relevant details. Keep this in mind when interpreting responses, especially for name-based queries.
+- Check if every expected candidate name is mentioned in the context and, for each mentioned name, verify that there is sufficient supporting detail (e.g., descriptions of roles, achievements, metrics) that clearly justifies its inclusion.
+- Provide a fractional score between 0 and 1 and a single concise sentence as the explanation for each score.
 
-Golden Answer (expected candidate names and supporting evidence):
-\"\"\"{golden}\"\"\"
+Checks:
+1. "context_recall": does the context provide all the necessary supporting evidence? Explicitly state if the evidence is missing entirely, present but insufficient, or if both issues exist, and comment on whether the context is properly grounded (i.e., the supporting evidence is clearly connected to the candidate names). A score of 0.8 means 80% of required evidence is present.
+2. "context_precision": is the context focused on that evidence? Assess whether it includes extraneous or irrelevant details that do not contribute to the evidence, and state whether all expected names/evidence are present without extraneous content, present but mixed with a lot of irrelevant details, or missing/insufficient. A higher score means the context is highly focused and contains little irrelevant information; a lower score means much of it is extraneous relative to the expected evidence.
+
+Return only a valid JSON object with exactly these keys:
+{{
+  "context_recall": {{
+    "score": <fraction between 0 and 1>,
+    "reason": "<a single, concise sentence explaining your evaluation>"
+  }},
+  "context_precision": {{
+    "score": <fraction between 0 and 1>,
+    "reason": "<a single, concise sentence explaining your evaluation>"
+  }}
+}}
+"""
 
+# New prompt for Faithfulness Evaluation
+def make_faithfulness_prompt(golden: str, generated: str) -> str:
+    return f"""{golden_block(golden)}
 Generated Answer:
 \"\"\"{generated}\"\"\"
 
+Task: evaluate the faithfulness of the generated answer above against the golden reference answer, which lists expected candidate names and supporting evidence.
+
 Instructions:
 - Check if each expected candidate name is present in the generated answer.
 - Determine if the generated answer includes sufficient supporting details (e.g., role descriptions, achievements, metrics) for each name.
@@ -137,15 +434,25 @@ Return only a valid JSON object with exactly these keys:
 }}
 """
 
+# First '{' through last '}': for the usual reply (one object, maybe fenced) this is the whole answer
+JSON_BLOCK = re.compile(r"\{.*\}", re.DOTALL)
+
 def extract_json_from_text(text: str) -> str:
     """
     Extracts the first JSON object from the provided text by finding the first '{'
     and then finding the corresponding closing '}'.
     Returns the extracted JSON string or an empty string if not found.
     """
-    start = text.find("{")
-    if start == -1:
+    match = JSON_BLOCK.search(text)
+    if match is None:
         return ""
+    try:
+        loads(match.group(0))
+        return match.group(0)
+    except ValueError:
+        pass
+    # Trailing prose with braces after the object: fall back to counting
+    start = match.start()
     count = 0
     for i in range(start, len(text)):
         if text[i] == "{":
@@ -156,6 +463,22 @@ def extract_json_from_text(text: str) -> str:
                 return text[start:i+1]
     return ""
 
+def is_parseable(content: str) -> bool:
+    try:
+        loads(extract_json_from_text(content))
+        return True
+    except ValueError:
+        return False
+
+# The prompts evaluate_query will send for one log entry, so batch mode can submit them up front
+def evaluation_prompts(golden_entry, log_entry: dict, mode: str) -> list:
+    context = log_entry["context"]
+    if mode == "faithfulness":
+        return [make_faithfulness_prompt(golden_entry, log_entry["response"])]
+    if COMBINED_EVAL_PROMPT:
+        return [make_combined_retrieval_prompt(golden_entry, context)]
+    return [make_context_recall_prompt(golden_entry, recall_context(golden_entry, context)), make_context_precision_prompt(golden_entry, context)]
+
 # Evaluate a single query (sequential LLM calls) based on evaluation mode
 async def evaluate_query(query: str, golden_entry: str, log_entry: dict, mode: str) -> dict:
     context = log_entry["context"]
@@ -167,12 +490,14 @@ async def evaluate_query(query: str, golden_entry: str, log_entry: dict, mode: s
         faith_prompt = make_faithfulness_prompt(golden_entry, generated)
         try:
             print(f"🔍 [Faithfulness] Evaluating query: {query[:60]}...")
-            faith_llm_raw = await call_azure_llm(faith_prompt)
+            faith_llm_raw = await call_azure_llm(
+                faith_prompt, semantic_key=(SemanticCache.namespace("faithfulness", golden_entry), generated)
+            )
             json_str_faith = extract_json_from_text(faith_llm_raw)
             if not json_str_faith:
                 faith_parsed = {"score": 0, "reason": "Empty response"}
             else:
-                faith_parsed = json.loads(json_str_faith)
+                faith_parsed = loads(json_str_faith)
             result["faithfulness"] = {
                 "score": faith_parsed.get("score", 0),
                 "reason": faith_parsed.get("reason", ""),
@@ -181,38 +506,70 @@ async def evaluate_query(query: str, golden_entry: str, log_entry: dict, mode: s
         except Exception as e:
             result["faithfulness"] = {"score": 0, "reason": f"Error: {str(e)}", "raw_response": ""}
             print(f"⚠️ [Faithfulness] Error for query '{query[:40]}': {str(e)}")
-    else:
-        # Retrieval evaluation (Context Recall & Context Precision)
-        # Evaluate context recall
-        recall_prompt = make_context_recall_prompt(golden_entry, context)
+    elif COMBINED_EVAL_PROMPT:
+        # Retrieval evaluation: both metrics from a single completion
+        combined_prompt = make_combined_retrieval_prompt(golden_entry, context)
         try:
-            print(f"🔍 [Context Recall] Evaluating query: {query[:60]}...")
-            recall_llm_raw = await call_azure_llm(recall_prompt)
-            json_str_recall = extract_json_from_text(recall_llm_raw)
-            if not json_str_recall:
-                recall_parsed = {"score": 0, "reason": "Empty response"}
-            else:
-                recall_parsed = json.loads(json_str_recall)
+            print(f"🔍 [Context Recall + Precision] Evaluating query: {query[:60]}...")
+            llm_raw = await call_azure_llm(combined_prompt)
+            json_str = extract_json_from_text(llm_raw)
+            parsed = loads(json_str) if json_str else {}
         except Exception as e:
-            recall_llm_raw = ""
-            recall_parsed = {"score": 0, "reason": f"Error: {str(e)}"}
-            print(f"⚠️ [Context Recall] Error for query '{query[:40]}': {str(e)}")
-    
-        # Evaluate context precision
-        precision_prompt = make_context_precision_prompt(golden_entry, context)
-        try:
-            print(f"🔍 [Context Precision] Evaluating query: {query[:60]}...")
-            precision_llm_raw = await call_azure_llm(precision_prompt)
-            json_str_precision = extract_json_from_text(precision_llm_raw)
-            if not json_str_precision:
-                precision_parsed = {"score": 0, "reason": "Empty response"}
-            else:
-                precision_parsed = json.loads(json_str_precision)
-        except Exception as e:
-            precision_llm_raw = ""
-            precision_parsed = {"score": 0, "reason": f"Error: {str(e)}"}
-            print(f"⚠️ [Context Precision] Error for query '{query[:40]}': {str(e)}")
-    
+            llm_raw = ""
+            parsed = {}
+            error = f"Error: {str(e)}"
+            print(f"⚠️ [Context Recall + Precision] Error for query '{query[:40]}': {str(e)}")
+        else:
+            error = "Empty response" if not json_str else None
+
+        for key in ("context_recall", "context_precision"):
+            section = parsed.get(key) if isinstance(parsed, dict) else None
+            if not isinstance(section, dict):
+                section = {"score": 0, "reason": error or f"Error: no '{key}' section in combined response"}
+            result[key] = {
+                "score": section.get("score", 0),
+                "reason": section.get("reason", ""),
+                "raw_response": llm_raw
+            }
+    else:
+        # Retrieval evaluation (Context Recall & Context Precision)
+        # Both prompts only read the golden entry and context, so they go out together
+        async def evaluate_recall():
+            recall_prompt = make_context_recall_prompt(golden_entry, recall_context(golden_entry, context))
+            try:
+                print(f"🔍 [Context Recall] Evaluating query: {query[:60]}...")
+                recall_llm_raw = await call_azure_llm(recall_prompt)
+                json_str_recall = extract_json_from_text(recall_llm_raw)
+                if not json_str_recall:
+                    recall_parsed = {"score": 0, "reason": "Empty response"}
+                else:
+                    recall_parsed = loads(json_str_recall)
+            except Exception as e:
+                recall_llm_raw = ""
+                recall_parsed = {"score": 0, "reason": f"Error: {str(e)}"}
+                print(f"⚠️ [Context Recall] Error for query '{query[:40]}': {str(e)}")
+            return recall_llm_raw, recall_parsed
+
+        async def evaluate_precision():
+            precision_prompt = make_context_precision_prompt(golden_entry, context)
+            try:
+                print(f"🔍 [Context Precision] Evaluating query: {query[:60]}...")
+                precision_llm_raw = await call_azure_llm(precision_prompt)
+                json_str_precision = extract_json_from_text(precision_llm_raw)
+                if not json_str_precision:
+                    precision_parsed = {"score": 0, "reason": "Empty response"}
+                else:
+                    precision_parsed = loads(json_str_precision)
+            except Exception as e:
+                precision_llm_raw = ""
+                precision_parsed = {"score": 0, "reason": f"Error: {str(e)}"}
+                print(f"⚠️ [Context Precision] Error for query '{query[:40]}': {str(e)}")
+            return precision_llm_raw, precision_parsed
+
+        (recall_llm_raw, recall_parsed), (precision_llm_raw, precision_parsed) = await asyncio.gather(
+            evaluate_recall(), evaluate_precision()
+        )
+
         result["context_recall"] = {
             "score": recall_parsed.get("score", 0),
             "reason": recall_parsed.get("reason", ""),
@@ -223,80 +580,138 @@ async def evaluate_query(query: str, golden_entry: str, log_entry: dict, mode: s
             "reason": precision_parsed.get("reason", ""),
             "raw_response": precision_llm_raw
         }
+
+    if not KEEP_RAW_RESPONSES:
+        for metric in result.values():
+            if isinstance(metric, dict):
+                metric.pop("raw_response", None)
     return result
 
-# Run evaluation pipeline sequentially for all queries with a unified result per query
-async def evaluate_pipeline(name: str, logs: list, golden_answers: dict, mode: str):
+def is_rate_limited(entry: dict, mode: str) -> bool:
+    metrics = ("faithfulness",) if mode == "faithfulness" else ("context_recall", "context_precision")
+    return any("429 Too Many Requests" in (entry.get(metric, {}).get("reason") or "") for metric in metrics)
+
+# Run evaluation pipeline concurrently for all queries with a unified result per query
+async def evaluate_pipeline(name: str, logs: list, golden_answers: dict, mode: str, concurrency: int = MAX_CONCURRENT_QUERIES, use_batch: bool = False):
     print(f"\n🚀 Starting evaluation for: {name.upper()} | Total queries: {len(logs)} | Mode: {mode}\n")
     output_file = OUTPUT_DIR / f"{name}_eval_v2.json"
+    # One line per finished query; folded into output_file at the end of the run
+    journal_file = OUTPUT_DIR / f"{name}_eval_v2.jsonl"
+
+    def merge_result(query, evaluation):
+        if query in results_dict:
+            results_dict[query].update(evaluation)
+        else:
+            results_dict[query] = evaluation
 
     results_dict = {}
     # Load existing results if available (optional)
     if output_file.exists():
         print(f"🔁 Loading previously saved results from {output_file}")
         with open(output_file, "r", encoding="utf-8") as f:
-            existing_results = json.load(f)
+            existing_results = load_json_stream(f)
         for entry in existing_results:
             results_dict[entry["query"]] = entry
 
-    # Process each log entry sequentially
+    # Replay queries finished by an interrupted run
+    if journal_file.exists():
+        print(f"🔁 Replaying journaled results from {journal_file}")
+        with open(journal_file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    evaluation = loads(line)
+                except ValueError:
+                    continue  # torn last line
+                merge_result(evaluation["query"], evaluation)
+
+    def save_results():
+        # Write-then-rename so a crash mid-write never leaves a truncated checkpoint behind
+        tmp_file = output_file.with_suffix(".json.tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            dump_json_stream(list(results_dict.values()), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, output_file)
+
+    # Saved entries whose result for this mode was a 429 failure; decided once, not per log entry
+    rerun_queries = {q for q, entry in results_dict.items() if is_rate_limited(entry, mode)}
+
+    # Collect the log entries that still need evaluating
+    pending = []
+    golden_keys = frozenset(golden_answers)
     for idx, log_entry in enumerate(logs, 1):
         query = log_entry["query"]
-        if query not in golden_answers:
+        if query not in golden_keys:
             print(f"⚠️  Skipping query not in golden set: '{query[:60]}...'")
             continue
 
         # ⏭️ Skip logic: check if already evaluated and not a 429 error
         if query in results_dict:
-            existing_entry = results_dict[query]
-            reasons = []
-
-            if mode == "faithfulness":
-                reasons.append(existing_entry.get("faithfulness", {}).get("reason", ""))
-            elif mode == "retrieval":
-                reasons.append(existing_entry.get("context_recall", {}).get("reason", ""))
-                reasons.append(existing_entry.get("context_precision", {}).get("reason", ""))
-
-            if all("429 Too Many Requests" not in r for r in reasons if r):
+            if query not in rerun_queries:
                 print(f"⏭️  Skipping already evaluated query [{idx}]: '{query[:60]}...'")
                 continue
-            else:
-                print(f"🔁 Re-evaluating due to 429 error: '{query[:60]}...'")
+            print(f"🔁 Re-evaluating due to 429 error: '{query[:60]}...'")
+
+        pending.append((idx, query, log_entry))
+
+    if use_batch and pending:
+        prompts = [p for _, query, log_entry in pending for p in evaluation_prompts(golden_answers[query], log_entry, mode)]
+        batch_responses.update(await run_batch_job(prompts))
+
+    sem = asyncio.Semaphore(concurrency)
+
+    async def evaluate_one(idx, query, log_entry):
+        async with sem:
+            print(f"\n🔹 [{idx}/{len(logs)}] Query:\n{query[:80]}...\n")
+            golden_entry = golden_answers[query]  # the golden evidence
+            return query, await evaluate_query(query, golden_entry, log_entry, mode)
+
+    # Persist each result as soon as it lands: append just this query instead of rewriting the whole file
+    with open(journal_file, "a", encoding="utf-8") as journal:
+        for next_done in asyncio.as_completed([evaluate_one(*item) for item in pending]):
+            query, evaluation = await next_done
+            merge_result(query, evaluation)
+            journal.write(json.dumps(evaluation, ensure_ascii=False) + "\n")
+            journal.flush()
+
+    # Final save in log order (incremental saves follow completion order)
+    order = {log_entry["query"]: i for i, log_entry in enumerate(logs)}
+    ordered = sorted(results_dict.items(), key=lambda kv: order.get(kv[0], len(order)))
+    results_dict.clear()
+    results_dict.update(ordered)
+    save_results()
+    journal_file.unlink(missing_ok=True)
 
-
-        print(f"\n🔹 [{idx}/{len(logs)}] Query:\n{query[:80]}...\n")
-        golden_entry = golden_answers[query]  # the golden evidence
-
-        evaluation = await evaluate_query(query, golden_entry, log_entry, mode)
-        if query in results_dict:
-            results_dict[query].update(evaluation)
-        else:
-            results_dict[query] = evaluation
-
-        # Save incrementally (convert dict values to list)
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(list(results_dict.values()), f, indent=2, ensure_ascii=False)
-    
     print(f"\n✅ Saved evaluation results for {name.upper()} to: {output_file}\n")
 
 # MAIN
 async def main():
+    global KEEP_RAW_RESPONSES
     parser = argparse.ArgumentParser()
     parser.add_argument("--pipeline", required=True, choices=["naive", "optimize"], help="Pipeline to evaluate")
     parser.add_argument("--mode", required=True, choices=["retrieval", "faithfulness"], help="Evaluation mode: retrieval (context recall and precision) or faithfulness")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENT_QUERIES, help="Queries evaluated at once")
+    parser.add_argument("--batch", action="store_true", help="Submit all prompts as one Azure Batch API job before evaluating")
+    parser.add_argument("--keep-raw", action="store_true", default=KEEP_RAW_RESPONSES, help="Also store each metric's raw Azure reply")
     args = parser.parse_args()
+    KEEP_RAW_RESPONSES = args.keep_raw
 
     print("📥 Loading input files...")
-    golden = load_json(GOLDEN_ANSWER_FILE)
-    # Assuming golden is a dict with query text as keys and broad evidence as value
-    golden_map = {k: v for k, v in golden.items()}
-    naive_logs = load_json(NAIVE_LOGS_FILE)
-    optimize_logs = load_json(OPTIMIZE_LOGS_FILE)
-
-    if args.pipeline == "naive":
-        await evaluate_pipeline("naive", naive_logs, golden_map, args.mode)
-    elif args.pipeline == "optimize":
-        await evaluate_pipeline("optimize", optimize_logs, golden_map, args.mode)
+    # Only read the log for the pipeline being evaluated
+    logs_file = NAIVE_LOGS_FILE if args.pipeline == "naive" else OPTIMIZE_LOGS_FILE
+    logs = load_query_log(logs_file)
+    # Golden is a dict with query text as keys and broad evidence as value
+    golden_map = load_golden_answers(GOLDEN_ANSWER_FILE, {e["query"] for e in logs})
+
+    try:
+        await evaluate_pipeline(args.pipeline, logs, golden_map, args.mode, args.concurrency, args.batch)
+    finally:
+        await aclose()
+        if _semantic_cache is not None:
+            _semantic_cache.save()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
@@ -1,7 +1,13 @@
 import os
-import json
+import sys
 import pandas as pd
+from pandas.api.types import union_categoricals
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# Shared helpers live under src/; make them importable when this file is run as a script
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.json_io import load_json, load_query_log
 
 # === CONFIGURATION ===
 # Toggle flags for which columns to include in the Excel output
@@ -19,38 +25,45 @@ QUERY_LOG_FILE = Path("compare/query_logs/naiveRag_query_logs.json")  # adjust i
 NULL_QUERIES_FILE = Path("data/null_queries.json")  # file containing queries to exclude
 
 # === FUNCTIONS ===
-def load_json(path: Path):
-    with open(path, encoding="utf-8") as f:
-        return json.load(f)
-
-def flatten_evaluation(evals: list, prefix: str):
-    records = []
-    for item in evals:
-        record = {"query": item.get("query", "")}
-        if "response" in item:
-            record[f"generated_answer_{prefix}"] = item.get("response", "")
-        cr = item.get("context_recall", {})
-        record[f"context_recall_score_{prefix}"] = cr.get("score", "")
-        record[f"context_recall_reason_{prefix}"] = cr.get("reason", "")
-        cp = item.get("context_precision", {})
-        record[f"context_precision_score_{prefix}"] = cp.get("score", "")
-        record[f"context_precision_reason_{prefix}"] = cp.get("reason", "")
-        fth = item.get("faithfulness", {})
-        record[f"faithfulness_score_{prefix}"] = fth.get("score", "")
-        record[f"faithfulness_reason_{prefix}"] = fth.get("reason", "")
-        records.append(record)
-    return records
-
-def flatten_query_log(logs: list):
-    records = []
-    for item in logs:
-        record = {
-            "query": item.get("query", ""),
-            "generated_answer_log": item.get("response", ""),
-            "log_context": item.get("context", "")
-        }
-        records.append(record)
-    return records
+# Nested result fields -> report column names (suffixed with the pipeline prefix); raw_response is never copied
+EVAL_COLUMNS = {
+    "response": "generated_answer",
+    "context_recall.score": "context_recall_score",
+    "context_recall.reason": "context_recall_reason",
+    "context_precision.score": "context_precision_score",
+    "context_precision.reason": "context_precision_reason",
+    "faithfulness.score": "faithfulness_score",
+    "faithfulness.reason": "faithfulness_reason",
+}
+
+def eval_fields(include: dict) -> list:
+    # Resolve the include flags to EVAL_COLUMNS fields up front, so the merges only carry report columns
+    return [
+        field for field in EVAL_COLUMNS
+        if include.get("generated_answer" if field == "response" else field.split(".")[0], False)
+    ]
+
+def flatten_evaluation(evals: list, prefix: str, fields=EVAL_COLUMNS) -> pd.DataFrame:
+    df = pd.json_normalize(evals, max_level=1)
+    columns = {
+        field: f"{EVAL_COLUMNS[field]}_{prefix}" for field in fields
+        if field != "response" or field in df.columns
+    }
+    return df.reindex(columns=["query", *columns]).rename(columns=columns).fillna("")
+
+def flatten_query_log(logs: list, include_context: bool = True) -> pd.DataFrame:
+    # Only the merge key and, when requested, the retrieved context; the logged response is never reported
+    columns = ["query", "context"] if include_context else ["query"]
+    df = pd.DataFrame(logs).reindex(columns=columns)
+    return df.rename(columns={"context": "log_context"}).fillna("")
+
+def share_query_categories(*frames: pd.DataFrame):
+    # One category set for every frame: the outer merges then hash int codes instead of long query strings.
+    # Outer merges order rows by category code, so the categories are sorted to keep the lexicographic
+    # row order the string-key merge produced.
+    categories = union_categoricals([pd.Categorical(df["query"]) for df in frames], sort_categories=True).categories
+    for df in frames:
+        df["query"] = pd.Categorical(df["query"], categories=categories)
 
 def merge_evaluation_data(naive_df: pd.DataFrame, optimize_df: pd.DataFrame) -> pd.DataFrame:
     return pd.merge(naive_df, optimize_df, on="query", how="outer", suffixes=("_naive", "_optimize"))
@@ -85,29 +98,28 @@ def load_null_queries(path: Path):
     return {entry["query_text"] for entry in null_data}
 
 def export_to_excel(merged_df: pd.DataFrame, output_path: str):
-    merged_df.to_excel(output_path, index=False)
+    # xlsxwriter writes the sheet straight to the zip instead of building openpyxl cell objects;
+    # skipping URL detection saves a regex match on every (long) text cell
+    with pd.ExcelWriter(
+        output_path,
+        engine="xlsxwriter",
+        engine_kwargs={"options": {"strings_to_urls": False}},
+    ) as writer:
+        merged_df.to_excel(writer, index=False)
     print(f"✅ Excel file generated: {output_path}")
 
 # === MAIN PROCESSING ===
 def main():
-    naive_eval_data = load_json(NAIVE_EVAL_FILE)
-    optimize_eval_data = load_json(OPTIMIZE_EVAL_FILE)
-    query_log_data = load_json(QUERY_LOG_FILE)
-    null_query_texts = load_null_queries(NULL_QUERIES_FILE)
-
-    naive_records = flatten_evaluation(naive_eval_data, "naive")
-    optimize_records = flatten_evaluation(optimize_eval_data, "optimize")
-    naive_df = pd.DataFrame(naive_records)
-    optimize_df = pd.DataFrame(optimize_records)
-
-    eval_merged_df = merge_evaluation_data(naive_df, optimize_df)
-
-    log_records = flatten_query_log(query_log_data)
-    log_df = pd.DataFrame(log_records)
-    final_merged_df = merge_with_query_log(eval_merged_df, log_df)
-
-    # 🚫 Remove rows where query is in the null queries list
-    final_merged_df = final_merged_df[~final_merged_df["query"].isin(null_query_texts)]
+    # The four inputs are independent; read and parse them side by side
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        naive_future = pool.submit(load_json, NAIVE_EVAL_FILE)
+        optimize_future = pool.submit(load_json, OPTIMIZE_EVAL_FILE)
+        log_future = pool.submit(load_query_log, QUERY_LOG_FILE)
+        null_future = pool.submit(load_null_queries, NULL_QUERIES_FILE)
+    naive_eval_data = naive_future.result()
+    optimize_eval_data = optimize_future.result()
+    query_log_data = log_future.result()
+    null_query_texts = null_future.result()
 
     include_flags = {
         "query": True,
@@ -118,6 +130,20 @@ def main():
         "log_context": INCLUDE_LOG_CONTEXT,
     }
 
+    # Project down to the flagged columns before merging; unused fields never reach the joins
+    fields = eval_fields(include_flags)
+    naive_df = flatten_evaluation(naive_eval_data, "naive", fields)
+    optimize_df = flatten_evaluation(optimize_eval_data, "optimize", fields)
+    log_df = flatten_query_log(query_log_data, include_context=INCLUDE_LOG_CONTEXT)
+    share_query_categories(naive_df, optimize_df, log_df)
+
+    eval_merged_df = merge_evaluation_data(naive_df, optimize_df)
+    final_merged_df = merge_with_query_log(eval_merged_df, log_df)
+
+    # 🚫 Remove rows where query is in the null queries list
+    final_merged_df = final_merged_df[~final_merged_df["query"].isin(null_query_texts)]
+
+    # The merged frame already holds only report columns; this just puts naive/optimize side by side
     final_df = select_columns(final_merged_df, include_flags)
 
     output_path = "evaluation_results.xlsx"
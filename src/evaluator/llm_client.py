@@ -0,0 +1,153 @@
+import os
+import json
+import random
+import asyncio
+import sqlite3
+import hashlib
+import itertools
+from dotenv import load_dotenv
+import httpx
+
+from common.json_io import loads
+
+# Azure OpenAI plumbing shared by the evaluators and the gold-answer generator
+
+# HTTP/2 lets concurrent prompts multiplex over one connection; needs the optional h2 package (httpx[http2])
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+load_dotenv()
+
+AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
+AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
+AZURE_OPENAI_DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT")
+# Optional comma-separated list of same-model deployments; calls rotate across them to pool their rate limits
+AZURE_OPENAI_DEPLOYMENTS = [
+    d.strip() for d in os.getenv("AZURE_OPENAI_DEPLOYMENTS", AZURE_OPENAI_DEPLOYMENT or "").split(",") if d.strip()
+]
+_deployment_cycle = itertools.cycle(AZURE_OPENAI_DEPLOYMENTS or [AZURE_OPENAI_DEPLOYMENT])
+AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2024-08-01-preview")
+
+def next_deployment():
+    return next(_deployment_cycle)
+
+def chat_completions_url(deployment=AZURE_OPENAI_DEPLOYMENT):
+    return f"{AZURE_OPENAI_ENDPOINT}/openai/deployments/{deployment}/chat/completions?api-version={AZURE_OPENAI_API_VERSION}"
+
+def request_headers():
+    return {
+        "Content-Type": "application/json",
+        "api-key": AZURE_OPENAI_API_KEY,
+    }
+
+# Retry transient Azure failures instead of recording them as errors
+MAX_RETRIES = int(os.getenv("EVAL_MAX_RETRIES", "5"))
+MAX_RETRY_DELAY = 30
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+async def with_retries(send, deployments=1):
+    """Await `send(attempt)` until it succeeds, retrying timeouts, transport errors and RETRYABLE_STATUS replies.
+
+    With several rotating `deployments`, a 429 moves straight on to the next one before backing off.
+    """
+    for attempt in range(MAX_RETRIES):
+        try:
+            return await send(attempt)
+        except (httpx.HTTPStatusError, httpx.TransportError) as e:
+            status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+            retryable = status is None or status in RETRYABLE_STATUS
+            if not retryable or attempt == MAX_RETRIES - 1:
+                raise
+            if status == 429 and attempt < deployments - 1:
+                print("⏳ Azure deployment throttled (429), trying the next deployment...")
+                continue
+            # Exponential backoff with jitter; honour Retry-After when Azure sends it
+            retry_after = e.response.headers.get("retry-after") if status else None
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else min(2 ** attempt, MAX_RETRY_DELAY) + random.random()
+            print(f"⏳ Azure call failed ({status or type(e).__name__}), retrying in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+
+# Shared HTTP client: keep-alive connections are reused across all Azure calls
+_http_client = None
+
+def get_http_client():
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=60,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=90),
+            http2=HTTP2_AVAILABLE,
+        )
+    return _http_client
+
+async def aclose():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+# Exact-match LLM cache: sha256(deployment, every other body field, normalized prompt) -> raw response text.
+# Re-running over unchanged inputs then costs no Azure calls at all.
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "data/.llm_cache.sqlite")
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+_llm_cache = None
+
+def get_llm_cache():
+    global _llm_cache
+    if _llm_cache is None:
+        os.makedirs(os.path.dirname(LLM_CACHE_PATH) or ".", exist_ok=True)
+        _llm_cache = sqlite3.connect(LLM_CACHE_PATH)
+        _llm_cache.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL)")
+        _llm_cache.commit()
+    return _llm_cache
+
+def llm_cache_key(body: dict) -> str:
+    # Collapse whitespace so cosmetic prompt edits don't invalidate the cache
+    messages = [(m["role"], " ".join(m["content"].split())) for m in body["messages"]]
+    # response_format, top_p, stream etc. all change the reply, so every non-message field is hashed
+    params = {k: v for k, v in body.items() if k != "messages"}
+    raw = json.dumps([AZURE_OPENAI_DEPLOYMENT, params, messages], sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def get_cached_response(key: str):
+    row = get_llm_cache().execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def set_cached_response(key: str, response: str):
+    conn = get_llm_cache()
+    conn.execute("INSERT OR REPLACE INTO responses (key, response) VALUES (?, ?)", (key, response))
+    conn.commit()
+
+def extract_json_object(text: str) -> str:
+    """Return the first balanced {...} span in an LLM reply, skipping prose, code fences and braces inside strings."""
+    start = text.find("{")
+    if start == -1:
+        return text.strip()
+    depth = 0
+    in_string = escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return text[start:]
+
+def parse_llm_json(content: str):
+    return loads(extract_json_object(content))
+
+JSON_ONLY_REMINDER = "\n\nReturn ONLY the JSON object, with no prose or code fences."
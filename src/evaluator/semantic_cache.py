@@ -0,0 +1,105 @@
+import os
+import pickle
+import hashlib
+import threading
+import numpy as np
+
+# Bumped whenever what gets namespaced or embedded changes; pickles in an older format are ignored
+CACHE_FORMAT = 2
+
+
+class SemanticCache:
+    """Embeddings in an in-memory numpy matrix, with their responses, pickled to disk.
+
+    A lookup only considers entries in the same namespace. Callers put everything that must match
+    exactly into the namespace (prompt kind, golden answer, context) and embed only the text that is
+    allowed to differ slightly, so a shared prompt prefix can never make two prompts look alike.
+    """
+
+    def __init__(self, path, model_name, threshold, batch_size=256):
+        self.path = path
+        self.model_name = model_name
+        self.threshold = threshold
+        self.batch_size = batch_size
+        self.model = None
+        self.model_lock = threading.Lock()
+        self.rows = []
+        self.responses = []
+        self.namespaces = []
+        self.matrix = None
+        self.namespace_array = None
+        if path.exists():
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+            if data.get("model") == model_name and data.get("format") == CACHE_FORMAT:
+                self.rows = list(data["embeddings"])
+                self.responses = data["responses"]
+                self.namespaces = data["namespaces"]
+            print(f"🧠 Loaded {len(self.responses)} semantic cache entries from {path}")
+
+    @staticmethod
+    def namespace(*parts):
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(str(part).encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()[:32]
+
+    def load_model(self):
+        if self.model is None:
+            import torch
+            from sentence_transformers import SentenceTransformer
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+            self.model = SentenceTransformer(self.model_name, device=device)
+        return self.model
+
+    def embed(self, text):
+        with self.model_lock:
+            return self.load_model().encode(text, normalize_embeddings=True).astype(np.float32)
+
+    def warm(self, texts, responses, namespaces):
+        """Bulk-load historical (text, response) pairs with one batched encode call."""
+        if not texts:
+            return
+        with self.model_lock:
+            vectors = self.load_model().encode(
+                texts,
+                batch_size=self.batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+            ).astype(np.float32)
+        self.rows.extend(vectors)
+        self.responses.extend(responses)
+        self.namespaces.extend(namespaces)
+        self.matrix = None
+        print(f"🧠 Warmed semantic cache with {len(texts)} entries")
+
+    def lookup(self, vector, namespace):
+        if not self.rows:
+            return None
+        if self.matrix is None:
+            self.matrix = np.vstack(self.rows)
+            self.namespace_array = np.array(self.namespaces)
+        scores = np.where(self.namespace_array == namespace, self.matrix @ vector, -1.0)
+        best = int(np.argmax(scores))
+        return self.responses[best] if scores[best] >= self.threshold else None
+
+    def add(self, vector, response, namespace):
+        self.rows.append(vector)
+        self.responses.append(response)
+        self.namespaces.append(namespace)
+        self.matrix = None
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        embeddings = np.vstack(self.rows) if self.rows else np.empty((0, 0), dtype=np.float32)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump({
+                "model": self.model_name,
+                "format": CACHE_FORMAT,
+                "embeddings": embeddings,
+                "responses": self.responses,
+                "namespaces": self.namespaces,
+            }, f)
+        os.replace(tmp_path, self.path)
@@ -1,7 +1,13 @@
-import json
+import os
+import sys
 import pandas as pd
+from functools import partial
 from pathlib import Path
 
+# Shared helpers live under src/; make them importable when this file is run as a script
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.json_io import load_json_stream, dump_json_stream, dumps
+
 # Input and output paths
 INPUT_JSON = Path("data/gold_query_matrix.json")
 OUTPUT_EXCEL = Path("data/golden_answers_review.xlsx")
@@ -9,7 +15,7 @@ NULL_QUERIES_LOG = Path("data/null_queries.json")
 
 def load_gold_matrix(filepath):
     with open(filepath, "r", encoding="utf-8") as f:
-        return json.load(f)
+        return load_json_stream(f)
 
 def is_valid_answer(answer):
     return answer not in (None, "null", "Null", "NULL", {}, [])
@@ -53,10 +59,11 @@ def save_to_excel(compiled_answers, output_path):
             sheet_name = f"Query_{i+1}"
             df = pd.DataFrame(entries)
 
-            # Convert dict-type answers to JSON strings
-            df["answer"] = df["answer"].apply(
-                lambda x: json.dumps(x, ensure_ascii=False, indent=2) if isinstance(x, (dict, list)) else str(x)
-            )
+            # Convert dict-type answers to JSON strings; only those rows go through the serializer,
+            # everything else is cast to str in one pass
+            answers = df["answer"]
+            structured = answers.map(type).isin((dict, list))
+            df["answer"] = answers.astype(str).where(~structured, answers[structured].map(partial(dumps, indent=True)))
 
             df.to_excel(writer, index=False, sheet_name=sheet_name)
 
@@ -70,7 +77,7 @@ def save_to_excel(compiled_answers, output_path):
 def save_json(data, filepath):
     filepath.parent.mkdir(parents=True, exist_ok=True)
     with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+        dump_json_stream(data, f)
 
 def main():
     print("📥 Loading matrix...")
@@ -1,8 +1,38 @@
 import os
+import sys
 import json
+import asyncio
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
-import requests
+
+# libuv-backed event loop: lower per-task overhead once many requests are in flight (Linux/macOS only)
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# Shared helpers live under src/; make them importable when this file is run as a script
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.json_io import loads, load_json_stream, dump_json_stream
+from evaluator.llm_client import (
+    AZURE_OPENAI_DEPLOYMENTS,
+    JSON_ONLY_REMINDER,
+    LLM_CACHE_ENABLED,
+    aclose,
+    chat_completions_url,
+    get_cached_response,
+    get_http_client,
+    llm_cache_key,
+    next_deployment,
+    parse_llm_json,
+    request_headers,
+    set_cached_response,
+    with_retries,
+)
 
 # Load environment variables
 load_dotenv()
@@ -11,111 +41,234 @@ load_dotenv()
 RESUMES_DIR = Path("data/processed_resumes")
 QUERIES_FILE = Path("data/test_queries.json")
 OUTPUT_MATRIX_FILE = Path("data/gold_query_matrix.json")
+# Append-only journal of per-resume answers; folded into OUTPUT_MATRIX_FILE at each checkpoint
+OUTPUT_JOURNAL_FILE = Path("data/gold_query_matrix.jsonl")
+CHECKPOINT_EVERY = int(os.getenv("GOLD_CHECKPOINT_EVERY", "50"))
+
+# Resumes packed into one LLM prompt; more resumes per call means fewer calls against the RPM limit,
+# with diminishing returns (and longer outputs) beyond ~4-8 for this output size
+RESUME_BATCH_SIZE = int(os.getenv("GOLD_RESUME_BATCH_SIZE", "4"))
+MAX_BATCH_OUTPUT_TOKENS = int(os.getenv("GOLD_MAX_OUTPUT_TOKENS", "16384"))
+
+# Batches in flight against Azure at once
+MAX_CONCURRENT_BATCHES = int(os.getenv("GOLD_MAX_CONCURRENCY", "8"))
 
-AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
-AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
-AZURE_OPENAI_DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT")
-AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2024-08-01-preview")
+# Resume files read ahead in worker threads while earlier ones are being submitted
+RESUME_READ_AHEAD = int(os.getenv("GOLD_READ_AHEAD", "16"))
 
+# Batched prompts produce long answers, so allow more time per request than the evaluators do
+REQUEST_TIMEOUT = int(os.getenv("GOLD_REQUEST_TIMEOUT", "120"))
 
 # --- Loaders ---
 def load_test_queries():
     with open(QUERIES_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)  # List of query strings
+        return load_json_stream(f)  # List of query strings
 
 
 def load_existing_matrix():
     if OUTPUT_MATRIX_FILE.exists():
         with open(OUTPUT_MATRIX_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+            return load_json_stream(f)
     return None  # Important for initializing correctly later
 
 
 def save_matrix(matrix):
     OUTPUT_MATRIX_FILE.parent.mkdir(parents=True, exist_ok=True)
-    with open(OUTPUT_MATRIX_FILE, "w", encoding="utf-8") as f:
-        json.dump(matrix, f, indent=2, ensure_ascii=False)
+    tmp_path = OUTPUT_MATRIX_FILE.with_suffix(".json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        dump_json_stream(matrix, f)
+    os.replace(tmp_path, OUTPUT_MATRIX_FILE)
+
+
+def append_journal(resume_filename, answers):
+    OUTPUT_JOURNAL_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(OUTPUT_JOURNAL_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"resume": resume_filename, "answers": answers}, ensure_ascii=False) + "\n")
+
+
+def replay_journal(matrix):
+    if not OUTPUT_JOURNAL_FILE.exists():
+        return 0
+    replayed = 0
+    with open(OUTPUT_JOURNAL_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn last line from an interrupted run
+            for query_entry in matrix:
+                query_entry["results"][row["resume"]] = row["answers"].get(query_entry["query_text"])
+            replayed += 1
+    return replayed
+
+
+def checkpoint_matrix(matrix):
+    # Consolidated JSON holds everything in the journal, so the journal can start over
+    save_matrix(matrix)
+    OUTPUT_JOURNAL_FILE.unlink(missing_ok=True)
 
 
 
 # --- Prompt builder ---
+STRICT_INSTRUCTIONS = (
+    "====================\n"
+    "🔒 STRICT INSTRUCTIONS:\n"
+    "- Match ONLY when the resume **clearly and fully** satisfies the query.\n"
+    "- If a query has multiple parts (e.g., DevOps + Kubernetes), ALL parts must be present.\n"
+    "- Do NOT make assumptions, guesses, or inferences beyond what's explicitly written.\n"
+    "- Do NOT hallucinate structured answers like job transitions or timelines unless they are clearly stated.\n"
+    "- Do NOT fabricate summaries or extract vague interpretations.\n"
+    "- If nothing clearly matches, return null.\n"
+    "- Never reuse answers across unrelated queries.\n\n"
+)
+
+ANSWER_VALUE_RULES = (
+    "Each value must be:\n"
+    "- A directly quoted or accurately paraphrased snippet from the resume (if relevant), OR\n"
+    "- null (if not clearly present or incomplete).\n\n"
+)
+
+FINAL_CHECK = (
+    "✅ Final Check: Ensure every answer is specific to the exact query. "
+    "DO NOT fabricate structured objects. "
+    "Only return what is clearly evident in the resume."
+)
+
+
+# Static prompt parts, assembled once at import time
+SINGLE_PROMPT_HEADER = (
+    "You are an AI system helping an HR pipeline analyze resumes. "
+    "Your task is to evaluate how well a given resume answers a set of HR queries.\n\n"
+
+    + STRICT_INSTRUCTIONS +
+
+    "====================\n"
+    "🔎 CONTEXT:\n"
+    "You will receive the full content of one resume followed by a list of queries.\n"
+    "Respond to each query independently, based ONLY on the information inside the resume.\n\n"
+
+    "Resume:\n"
+)
+
+SINGLE_PROMPT_TRAILER = (
+    "\n====================\n"
+    "📤 OUTPUT FORMAT:\n"
+    "Return a JSON object with keys as the FULL query texts. Do not assume any structures unless clearly obvious.\n"
+    + ANSWER_VALUE_RULES +
+
+    "✅ Example:\n"
+    "{\n"
+    "  \"List candidates with DevOps and Kubernetes experience\": \"Worked as a DevOps Engineer using Docker and Kubernetes in CI/CD\",\n"
+    "  \"Who has experience with Java and React.js?\": null\n"
+    "}\n\n"
+
+    + FINAL_CHECK
+)
+
+BATCH_PROMPT_HEADER = (
+    "You are an AI system helping an HR pipeline analyze resumes. "
+    "Your task is to evaluate how well each of several resumes answers a set of HR queries.\n\n"
+
+    + STRICT_INSTRUCTIONS +
+
+    "====================\n"
+    "🔎 CONTEXT:\n"
+    "You will receive the full content of several resumes, each introduced by its file name in square brackets, "
+    "followed by a list of queries.\n"
+    "Evaluate every resume separately and never carry information from one resume into another.\n"
+    "Respond to each query independently, based ONLY on the information inside that resume.\n\n"
+)
+
+BATCH_PROMPT_TRAILER = (
+    "\n====================\n"
+    "📤 OUTPUT FORMAT:\n"
+    "Return a JSON object whose keys are the resume file names exactly as written inside the square brackets. "
+    "Each value is a JSON object with keys as the FULL query texts. Do not assume any structures unless clearly obvious.\n"
+    + ANSWER_VALUE_RULES +
+
+    "✅ Example:\n"
+    "{\n"
+    "  \"jane_doe.pdf\": {\n"
+    "    \"List candidates with DevOps and Kubernetes experience\": \"Worked as a DevOps Engineer using Docker and Kubernetes in CI/CD\",\n"
+    "    \"Who has experience with Java and React.js?\": null\n"
+    "  },\n"
+    "  \"john_smith.docx\": {\n"
+    "    \"List candidates with DevOps and Kubernetes experience\": null,\n"
+    "    \"Who has experience with Java and React.js?\": \"Built React.js front-ends backed by Java Spring services\"\n"
+    "  }\n"
+    "}\n\n"
+
+    + FINAL_CHECK
+)
+
+
+@lru_cache(maxsize=8)
+def queries_block(queries):
+    # Same query list for every resume in a run, so this is built once
+    return "Queries:\n" + "".join(f"- {q}\n" for q in queries)
+
+
 def build_prompt(resume_content, queries):
-    prompt = (
-        "You are an AI system helping an HR pipeline analyze resumes. "
-        "Your task is to evaluate how well a given resume answers a set of HR queries.\n\n"
-
-        "====================\n"
-        "🔒 STRICT INSTRUCTIONS:\n"
-        "- Match ONLY when the resume **clearly and fully** satisfies the query.\n"
-        "- If a query has multiple parts (e.g., DevOps + Kubernetes), ALL parts must be present.\n"
-        "- Do NOT make assumptions, guesses, or inferences beyond what's explicitly written.\n"
-        "- Do NOT hallucinate structured answers like job transitions or timelines unless they are clearly stated.\n"
-        "- Do NOT fabricate summaries or extract vague interpretations.\n"
-        "- If nothing clearly matches, return null.\n"
-        "- Never reuse answers across unrelated queries.\n\n"
-
-        "====================\n"
-        "🔎 CONTEXT:\n"
-        "You will receive the full content of one resume followed by a list of queries.\n"
-        "Respond to each query independently, based ONLY on the information inside the resume.\n\n"
-
-        "Resume:\n"
-        f"{resume_content}\n\n"
-
-        "Queries:\n"
-    )
-    for q in queries:
-        prompt += f"- {q}\n"
-
-    prompt += (
-        "\n====================\n"
-        "📤 OUTPUT FORMAT:\n"
-        "Return a JSON object with keys as the FULL query texts. Do not assume any structures unless clearly obvious.\n"
-        "Each value must be:\n"
-        "- A directly quoted or accurately paraphrased snippet from the resume (if relevant), OR\n"
-        "- null (if not clearly present or incomplete).\n\n"
-
-        "✅ Example:\n"
-        "{\n"
-        "  \"List candidates with DevOps and Kubernetes experience\": \"Worked as a DevOps Engineer using Docker and Kubernetes in CI/CD\",\n"
-        "  \"Who has experience with Java and React.js?\": null\n"
-        "}\n\n"
-
-        "✅ Final Check: Ensure every answer is specific to the exact query. "
-        "DO NOT fabricate structured objects. "
-        "Only return what is clearly evident in the resume."
-    )
-    return prompt
+    return f"{SINGLE_PROMPT_HEADER}{resume_content}\n\n{queries_block(tuple(queries))}{SINGLE_PROMPT_TRAILER}"
+
+
+def build_batch_prompt(resumes, queries):
+    """Prompt covering several (filename, content) resumes; answers come back keyed by filename."""
+    resumes_block = "".join(f"Resume [{filename}]:\n{content}\n\n" for filename, content in resumes)
+    return f"{BATCH_PROMPT_HEADER}{resumes_block}{queries_block(tuple(queries))}{BATCH_PROMPT_TRAILER}"
 
 
 # --- LLM API ---
-def call_llm(prompt):
-    headers = {
-        "Content-Type": "application/json",
-        "api-key": AZURE_OPENAI_API_KEY,
-    }
+async def call_llm(prompt, max_tokens=2048, retry_on_invalid=True):
+    headers = request_headers()
     body = {
         "messages": [
             {"role": "system", "content": "You are an AI assistant helping HR evaluate resumes."},
             {"role": "user", "content": prompt}
         ],
         "temperature": 0.2,
-        "max_tokens": 2048,
+        "max_tokens": max_tokens,
     }
-    url = f"{AZURE_OPENAI_ENDPOINT}/openai/deployments/{AZURE_OPENAI_DEPLOYMENT}/chat/completions?api-version={AZURE_OPENAI_API_VERSION}"
-    try:
-        response = requests.post(url, headers=headers, json=body)
+    cache_key = llm_cache_key(body) if LLM_CACHE_ENABLED else None
+    if cache_key:
+        cached = get_cached_response(cache_key)
+        if cached is not None:
+            return parse_llm_json(cached)
+
+    async def send(attempt):
+        # Each attempt goes to the next deployment, so a throttled one is not hit again straight away
+        url = chat_completions_url(next_deployment())
+        response = await get_http_client().post(url, headers=headers, json=body, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
-        content = response.json()["choices"][0]["message"]["content"]
-        return json.loads(content.strip().strip("```json").strip("```"))
+        return response.json()["choices"][0]["message"]["content"]
+
+    try:
+        content = await with_retries(send, deployments=len(AZURE_OPENAI_DEPLOYMENTS))
     except Exception as e:
         print(f"❌ LLM call failed: {e}")
         return None
 
+    try:
+        parsed = parse_llm_json(content)
+    except ValueError as e:
+        if retry_on_invalid:
+            print(f"↩️ LLM returned invalid JSON ({e}), retrying once with a JSON-only reminder...")
+            return await call_llm(prompt + JSON_ONLY_REMINDER, max_tokens, retry_on_invalid=False)
+        print(f"❌ LLM returned invalid JSON: {e}")
+        return None
+
+    # Only cache replies that parsed, so a malformed answer is retried on the next run
+    if cache_key:
+        set_cached_response(cache_key, content)
+    return parsed
+
 
 # --- Resume evaluator ---
-def is_resume_processed(matrix, resume_filename):
-    return all(resume_filename in entry.get("results", {}) for entry in matrix)
+def processed_resumes(matrix):
+    # A resume counts as processed only once every query has a result for it
+    if not matrix:
+        return set()
+    return set.intersection(*(set(entry.get("results", {})) for entry in matrix))
 
 
 def initialize_matrix(queries):
@@ -129,59 +282,144 @@ def initialize_matrix(queries):
     ]
 
 
-def process_resume(resume_file, queries, matrix):
-    with open(resume_file, "r", encoding="utf-8") as f:
-        resume_data = json.load(f)
-    resume_filename = resume_data.get("file", resume_file.name)
-    resume_content = resume_data.get("content", "")
+def load_resume(resume_file):
+    resume_data = loads(resume_file.read_bytes())
+    return resume_data.get("file", resume_file.name), resume_data.get("content", "")
+
+
+async def read_resumes(resume_files, read_ahead=RESUME_READ_AHEAD):
+    """Yield (filename, content) in directory order, keeping up to `read_ahead` reads in flight."""
+    loop = asyncio.get_running_loop()
+    files = iter(resume_files)
+    with ThreadPoolExecutor(max_workers=read_ahead) as pool:
+        reads = deque(loop.run_in_executor(pool, load_resume, f) for f in itertools.islice(files, read_ahead))
+        while reads:
+            resume = await reads.popleft()
+            for f in itertools.islice(files, 1):
+                reads.append(loop.run_in_executor(pool, load_resume, f))
+            yield resume
+
+
+def record_answers(matrix, resume_filename, llm_response):
+    answers = {}
+    for query_entry in matrix:
+        qtext = query_entry["query_text"]
+        answers[qtext] = query_entry["results"][resume_filename] = llm_response.get(qtext, None)
+    append_journal(resume_filename, answers)
 
-    if not resume_content.strip():
-        print(f"⚠️ Skipping empty resume: {resume_filename}")
-        return
 
+async def process_resume(resume_filename, resume_content, queries, matrix):
     prompt = build_prompt(resume_content, queries)
     print(f"🔍 Calling LLM for {resume_filename}...")
 
-    llm_response = call_llm(prompt)
+    llm_response = await call_llm(prompt)
     if not llm_response:
         print(f"⚠️ Skipping {resume_filename} due to failed LLM call.")
         return
 
-    query_text_to_id = {q: f"query_{i}" for i, q in enumerate(queries)}
+    record_answers(matrix, resume_filename, llm_response)
+    print(f"✅ Processed {resume_filename}")
 
-    for query_entry in matrix:
-        qid = query_entry["query_id"]
-        qtext = query_entry["query_text"]
-        answer = llm_response.get(qtext, None)
-        query_entry["results"][resume_filename] = answer
 
-    print(f"✅ Processed {resume_filename}")
+async def process_resume_batch(batch, queries, matrix):
+    """One LLM call for several resumes; resumes missing from a parsed reply are retried one at a time."""
+    if len(batch) == 1:
+        await process_resume(*batch[0], queries, matrix)
+        return
+
+    names = ", ".join(name for name, _ in batch)
+    print(f"🔍 Calling LLM for {len(batch)} resumes: {names}...")
+    prompt = build_batch_prompt(batch, queries)
+    llm_response = await call_llm(prompt, max_tokens=min(2048 * len(batch), MAX_BATCH_OUTPUT_TOKENS))
+    if not isinstance(llm_response, dict):
+        # The call itself failed (already retried) or never parsed: splitting the batch would only send
+        # more requests against the same limit, so these resumes are left for the next run
+        print(f"⚠️ Skipping {names} due to failed LLM call.")
+        return
+
+    for resume_filename, resume_content in batch:
+        answers = llm_response.get(resume_filename)
+        if isinstance(answers, dict):
+            record_answers(matrix, resume_filename, answers)
+            print(f"✅ Processed {resume_filename}")
+        else:
+            print(f"↩️ No batched answer for {resume_filename}, falling back to single-resume prompt.")
+            await process_resume(resume_filename, resume_content, queries, matrix)
 
 
 # --- Main ---
-def main():
+async def main():
     queries = load_test_queries()
     matrix = load_existing_matrix()
     if matrix is None:
         matrix = initialize_matrix(queries)
+    replayed = replay_journal(matrix)
+    if replayed:
+        print(f"🔁 Replayed {replayed} journaled resumes from {OUTPUT_JOURNAL_FILE}")
+
+    # Iterate the directory lazily so the first LLM call doesn't wait on a full listing
+    resume_files = RESUMES_DIR.glob("*.json")
+    print(f"📄 Scanning resumes in {RESUMES_DIR}\n🧪 Starting evaluation...\n")
+
+    processed = processed_resumes(matrix)
+    sem = asyncio.Semaphore(MAX_CONCURRENT_BATCHES)
+    tasks = []
+    since_checkpoint = 0
+
+    # Matrix updates, journal appends and checkpoints never await, so they
+    # cannot interleave on the single event loop and need no lock
+    async def run_batch(batch):
+        nonlocal since_checkpoint
+        try:
+            await process_resume_batch(batch, queries, matrix)
+        finally:
+            sem.release()
+        since_checkpoint += len(batch)
+        if since_checkpoint >= CHECKPOINT_EVERY:
+            checkpoint_matrix(matrix)
+            since_checkpoint = 0
+
+    async def submit(batch):
+        # Wait for a free slot before reading further, so only in-flight resumes are held in memory
+        await sem.acquire()
+        tasks.append(asyncio.create_task(run_batch(batch)))
 
-    resume_files = list(RESUMES_DIR.glob("*.json"))
-    print(f"📄 {len(resume_files)} resumes found.\n🧪 Starting evaluation...\n")
-
-    for resume_file in resume_files:
-        with open(resume_file, "r", encoding="utf-8") as f:
-            resume_data = json.load(f)
-        resume_filename = resume_data.get("file", resume_file.name)
-
-        if is_resume_processed(matrix, resume_filename):
-            print(f"⏩ Skipping {resume_filename} (already processed).")
-            continue
-
-        process_resume(resume_file, queries, matrix)
-        save_matrix(matrix)
+    try:
+        batch = []
+        # Each file is read once, off the event loop and a few at a time, so in-flight Azure calls
+        # keep progressing during disk I/O
+        async for resume_filename, resume_content in read_resumes(resume_files):
+
+            if resume_filename in processed:
+                print(f"⏩ Skipping {resume_filename} (already processed).")
+                continue
+
+            if not resume_content.strip():
+                print(f"⚠️ Skipping empty resume: {resume_filename}")
+                continue
+
+            batch.append((resume_filename, resume_content))
+            processed.add(resume_filename)
+            if len(batch) == RESUME_BATCH_SIZE:
+                await submit(batch)
+                batch = []
+
+        if batch:
+            await submit(batch)
+
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"⚠️ Batch failed: {result}")
+    finally:
+        await aclose()
+        checkpoint_matrix(matrix)
 
     print("\n✅ All resumes processed. Output saved to:", OUTPUT_MATRIX_FILE)
 
 
 if __name__ == "__main__":
-    main()
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
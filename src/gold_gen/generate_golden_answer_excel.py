@@ -1,70 +1,67 @@
-import json
-import pandas as pd
+import os
+import sys
+import xlsxwriter
 from pathlib import Path
 
+# Shared helpers live under src/; make them importable when this file is run as a script
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.json_io import load_json_stream, dumps
+
 # Input and output paths
 INPUT_JSON = Path("data/gold_query_matrix.json")
 OUTPUT_EXCEL = Path("data/gold_query_matrix.xlsx")
 
 def load_gold_matrix(filepath):
     with open(filepath, "r", encoding="utf-8") as f:
-        return json.load(f)
+        return load_json_stream(f)
 
-def convert_to_dataframe(matrix):
-    # Step 1: Collect all unique resume filenames
+def collect_resume_columns(matrix):
+    # All unique resume filenames, one column each
     all_resume_files = set()
     for entry in matrix:
         all_resume_files.update(entry["results"].keys())
+    return sorted(all_resume_files)
 
-    sorted_resumes = sorted(all_resume_files)
+def serialize_cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return dumps(value)
+    return str(value)
 
-    # Step 2: Create table rows
-    table = []
-    for entry in matrix:
-        row = {
-            "query_id": entry["query_id"],
-            "query_text": entry["query_text"],
-        }
-        for resume in sorted_resumes:
-            row[resume] = entry["results"].get(resume, None)
-        table.append(row)
-
-    df = pd.DataFrame(table)
-    return df, sorted_resumes
-
-def save_to_excel(df, sorted_resumes, output_path):
+def save_to_excel(matrix, sorted_resumes, output_path):
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    with pd.ExcelWriter(output_path, engine="xlsxwriter") as writer:
-        df.to_excel(writer, index=False, sheet_name="GoldMatrix")
-        workbook = writer.book
-        worksheet = writer.sheets["GoldMatrix"]
-
-        # Define styles
-        null_format = workbook.add_format({"bg_color": "#F0F0F0", "font_color": "#888888"})
-        match_format = workbook.add_format({"bg_color": "#E2F7E2"})
-        header_format = workbook.add_format({"bold": True, "bg_color": "#D9E1F2", "border": 1})
-        query_text_format = workbook.add_format({"text_wrap": True, "valign": "top"})
-
-        # Apply header formatting
-        for col_idx, value in enumerate(df.columns):
-            worksheet.write(0, col_idx, value, header_format)
-            worksheet.set_column(col_idx, col_idx, 25)
-
-        # Set wider column for query_text
-        worksheet.set_column(1, 1, 60, query_text_format)
-
-        # Apply cell formatting
-        for row_idx in range(1, len(df) + 1):
-            for col_idx in range(2, len(df.columns)):  # Resume columns only
-                cell_value = df.iloc[row_idx - 1, col_idx]
-                if cell_value is None or (isinstance(cell_value, float) and pd.isna(cell_value)):
-                    worksheet.write(row_idx, col_idx, None, null_format)
-                elif isinstance(cell_value, (dict, list)):
-                    worksheet.write(row_idx, col_idx, json.dumps(cell_value, ensure_ascii=False), match_format)
-                else:
-                    worksheet.write(row_idx, col_idx, str(cell_value), match_format)
+    # Rows are written straight from the matrix in order; constant_memory flushes each finished row
+    # to disk, so memory stays flat however many queries x resumes the matrix holds
+    workbook = xlsxwriter.Workbook(str(output_path), {"constant_memory": True, "strings_to_urls": False})
+    worksheet = workbook.add_worksheet("GoldMatrix")
+
+    # Define styles
+    null_format = workbook.add_format({"bg_color": "#F0F0F0", "font_color": "#888888"})
+    match_format = workbook.add_format({"bg_color": "#E2F7E2"})
+    header_format = workbook.add_format({"bold": True, "bg_color": "#D9E1F2", "border": 1})
+    query_text_format = workbook.add_format({"text_wrap": True, "valign": "top"})
+
+    # Column widths; query_text is wider and wrapped
+    worksheet.set_column(0, len(sorted_resumes) + 1, 25)
+    worksheet.set_column(1, 1, 60, query_text_format)
+
+    worksheet.write_row(0, 0, ["query_id", "query_text", *sorted_resumes], header_format)
+
+    for row_idx, entry in enumerate(matrix, 1):
+        worksheet.write(row_idx, 0, entry["query_id"])
+        worksheet.write_string(row_idx, 1, entry["query_text"], query_text_format)
+
+        # Resume columns: one serialized row per query, written in a single call
+        results = entry["results"]
+        worksheet.write_row(row_idx, 2, [serialize_cell(results.get(resume)) for resume in sorted_resumes], match_format)
+
+    # Null cells are written blank and greyed by one conditional format instead of per-cell formats
+    if matrix and sorted_resumes:
+        worksheet.conditional_format(1, 2, len(matrix), len(sorted_resumes) + 1, {"type": "blanks", "format": null_format})
 
+    workbook.close()
     print(f"✅ Excel file with styles saved to: {output_path}")
 
 def main():
@@ -72,10 +69,10 @@ def main():
     matrix = load_gold_matrix(INPUT_JSON)
     print(f"🧮 Loaded {len(matrix)} queries.")
 
-    df, sorted_resumes = convert_to_dataframe(matrix)
-    print(f"📊 Generated DataFrame with {df.shape[0]} rows and {df.shape[1]} columns.")
+    sorted_resumes = collect_resume_columns(matrix)
+    print(f"📊 Writing {len(matrix)} rows and {len(sorted_resumes) + 2} columns.")
 
-    save_to_excel(df, sorted_resumes, OUTPUT_EXCEL)
+    save_to_excel(matrix, sorted_resumes, OUTPUT_EXCEL)
 
 if __name__ == "__main__":
     main()
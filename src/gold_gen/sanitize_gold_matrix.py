@@ -1,13 +1,18 @@
-import json
+import os
+import sys
 from pathlib import Path
 
+# Shared helpers live under src/; make them importable when this file is run as a script
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common.json_io import load_json_stream, dump_json_stream
+
 # Input and output paths
 INPUT_JSON = Path("data/gold_query_matrix.json")
 OUTPUT_JSON = Path("data/golden_answers_compiled.json")
 
 def load_gold_matrix(filepath):
     with open(filepath, "r", encoding="utf-8") as f:
-        return json.load(f)
+        return load_json_stream(f)
 
 def extract_answers_with_source(matrix):
     query_to_answers = {}
@@ -31,7 +36,7 @@ def extract_answers_with_source(matrix):
 def save_aggregated_answers(data, output_path):
     output_path.parent.mkdir(parents=True, exist_ok=True)
     with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+        dump_json_stream(data, f)
     print(f"✅ Saved aggregated answers (with source) to: {output_path}")
 
 def main():
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import os
+
+os.makedirs("logs", exist_ok=True)
+logging.basicConfig(
+    filename="logs/pipeline.log",
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+MAX_BATCH_SIZE = int(os.getenv("QUERY_BATCH_SIZE", "16"))
+MAX_BATCH_WAIT = float(os.getenv("QUERY_BATCH_WAIT_MS", "50")) / 1000
+
+
+class QueryBatcher:
+    """
+    Collects concurrent retrieval requests for up to MAX_BATCH_WAIT seconds (or
+    MAX_BATCH_SIZE requests) and serves them with a single Retriever.batch_query call.
+    """
+
+    def __init__(self, retriever, max_batch=MAX_BATCH_SIZE, max_wait=MAX_BATCH_WAIT):
+        self.retriever = retriever
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = None
+        self._task = None
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+        logging.info(f"🧺 Query batcher started (max_batch={self.max_batch}, max_wait={self.max_wait}s)")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def query(self, query_text, top_k):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((query_text, top_k, future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            texts = [text for text, _, _ in batch]
+            top_k = max(k for _, k, _ in batch)
+            try:
+                # Embedding and Chroma search are blocking; keep them off the event loop
+                results = await asyncio.to_thread(self.retriever.batch_query, texts, top_k)
+            except Exception as e:
+                logging.error(f"❌ Batch retrieval error: {e}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, k, future), chunks in zip(batch, results):
+                if not future.done():
+                    future.set_result(chunks[:k])
@@ -4,6 +4,8 @@ from dotenv import load_dotenv
 import httpx
 import asyncio
 
+from common.json_io import loads, dumps
+
 load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -22,6 +24,37 @@ logging.basicConfig(
 )
 
 
+# Static instructions go first (system message) so the provider can reuse the cached
+# prompt prefix across requests; only the knowledge base and query vary per call.
+SYSTEM_PROMPT = """---Role---
+
+You are an intelligent and efficient HR assistant that helps analyze and respond to queries related to resumes and candidate information provided in the Knowledge Base.
+
+---Goal---
+
+Generate a clear, helpful, and concise response using only the resume data available in the Knowledge Base. This may include details such as education, experience, skills, certifications, projects, achievements, role transitions, work preferences, availability or listing all eligible candidates accroding to the conditions in query.
+
+Tailor your response to the intent behind the HR query, which may involve:
+- Identifying suitable candidates for specific technologies, tools, roles, or industries.
+- Filtering based on attributes like location, experience level, education, certifications, gaps, or functional transitions.
+- Summarizing key skills or project work for a given candidate or group.
+- Recognizing patterns such as career shifts, sabbaticals, leadership roles, or domain expertise.
+- **Insight-oriented**: Help HR understand patterns like shifts in roles, popular technologies in recent roles, commonly held degrees, or industry transitions.
+
+---Response Rules---
+- Target the response length and format according to the query.
+- Candidate names should be clearly identified and, if available, extracted from metadata or the resume text; minor formatting differences (e.g., extra characters, file extensions) should be ignored.
+- Do not assume anything that is not explicitly supported by the resume data.
+- Use markdown formatting (headings, bullet points, or tables) where it enhances clarity.
+- Redact or omit any critical personal information (phone numbers, email addresses, DOB, etc.).
+- Maintain a professional, concise tone and answer the query directly and accurately.
+- Respond in the same language as the query.
+- If you do not know the answer, state so clearly.
+- Avoid inferring candidate intent, strengths, or preferences unless explicitly mentioned.
+- Ensure that the answer is well-grounded by strictly using the provided Knowledge Base.
+"""
+
+
 class Generator:
     def __init__(
         self,
@@ -34,6 +67,7 @@ class Generator:
         self.use_optimize_llm = use_optimize_llm
         self.gemini_model_name = gemini_model
         self.openai_model_name = openai_model
+        self._http_client = None
 
         if self.use_optimize_llm:
             logging.info(f"🔌 Using OptimizeRag Azure OpenAI deployment: {AZURE_OPENAI_DEPLOYMENT}")
@@ -46,61 +80,37 @@ class Generator:
             import google.generativeai as genai
             genai.configure(api_key=GEMINI_API_KEY)
             self.genai = genai
-            self.model = genai.GenerativeModel(gemini_model)
+            self.model = genai.GenerativeModel(gemini_model, system_instruction=SYSTEM_PROMPT)
             logging.info(f"🔌 Using Gemini: {gemini_model}")
 
     async def generate_response(self, query, retrieved_chunks):
         return await self._generate(query, retrieved_chunks)
 
 
+    def build_prompt(self, query, context):
+        return f"""---Knowledge Base---
+{context}
+
+---User Query---
+{query}
+"""
+
     async def _generate(self, query, retrieved_chunks):
         logging.info(f"🧠 Generating response for query: {query}")
         if not retrieved_chunks:
             return "⚠️ No relevant information found.", "⚠️ No relevant information found."
 
-        context = "\n\n".join([f"- {chunk}" for chunk in retrieved_chunks])
-
-        prompt = f"""---Role---
-
-You are an intelligent and efficient HR assistant that helps analyze and respond to queries related to resumes and candidate information provided in the Knowledge Base.
-
----Goal---
-
-Generate a clear, helpful, and concise response using only the resume data available in the Knowledge Base. This may include details such as education, experience, skills, certifications, projects, achievements, role transitions, work preferences, availability or listing all eligible candidates accroding to the conditions in query.
+        context = build_context(retrieved_chunks)
 
-Tailor your response to the intent behind the HR query, which may involve:
-- Identifying suitable candidates for specific technologies, tools, roles, or industries.
-- Filtering based on attributes like location, experience level, education, certifications, gaps, or functional transitions.
-- Summarizing key skills or project work for a given candidate or group.
-- Recognizing patterns such as career shifts, sabbaticals, leadership roles, or domain expertise.
-- **Insight-oriented**: Help HR understand patterns like shifts in roles, popular technologies in recent roles, commonly held degrees, or industry transitions.
-
----Knowledge Base---
-{context}
-
----User Query---
-{query}
-
----Response Rules---
-- Target the response length and format according to the query.
-- Candidate names should be clearly identified and, if available, extracted from metadata or the resume text; minor formatting differences (e.g., extra characters, file extensions) should be ignored.
-- Do not assume anything that is not explicitly supported by the resume data.
-- Use markdown formatting (headings, bullet points, or tables) where it enhances clarity.
-- Redact or omit any critical personal information (phone numbers, email addresses, DOB, etc.).
-- Maintain a professional, concise tone and answer the query directly and accurately.
-- Respond in the same language as the query.
-- If you do not know the answer, state so clearly.
-- Avoid inferring candidate intent, strengths, or preferences unless explicitly mentioned.
-- Ensure that the answer is well-grounded by strictly using the provided Knowledge Base.
-"""
+        prompt = self.build_prompt(query, context)
 
         try:
             if self.use_optimize_llm:
                 print("Using OptimizeRag Azure LLM...")
-                result = await self._generate_optimize_llm(query, prompt)
+                result = await self._generate_optimize_llm(prompt, SYSTEM_PROMPT)
             elif self.use_openai:
                 messages = [
-                    {"role": "system", "content": "You are an HR assistant trained on candidate resumes."},
+                    {"role": "system", "content": SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ]
                 response = self.openai.ChatCompletion.create(
@@ -121,7 +131,49 @@ Tailor your response to the intent behind the HR query, which may involve:
             logging.error(f"❌ Generation error: {e}")
             return "⚠️ Error generating response.", "⚠️ Error generating response."
 
-    async def _generate_optimize_llm(self, user_prompt, system_prompt=""):
+    async def stream_response(self, query, retrieved_chunks):
+        """Yield the answer text incrementally as the LLM produces it."""
+        logging.info(f"🧠 Streaming response for query: {query}")
+        if not retrieved_chunks:
+            yield "⚠️ No relevant information found."
+            return
+
+        context = build_context(retrieved_chunks)
+        prompt = self.build_prompt(query, context)
+
+        parts = []
+        try:
+            if self.use_optimize_llm:
+                async for piece in self._stream_optimize_llm(prompt, SYSTEM_PROMPT):
+                    parts.append(piece)
+                    yield piece
+            else:
+                # OpenAI/Gemini clients used here are synchronous; emit the full answer as one chunk
+                result, _ = await self._generate(query, retrieved_chunks)
+                yield result
+                return
+
+            append_naive_log(query, context, "".join(parts))
+
+        except Exception as e:
+            logging.error(f"❌ Streaming generation error: {e}")
+            yield "⚠️ Error generating response."
+
+    def get_http_client(self):
+        # Reused across requests so Azure calls keep their TLS connection alive
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(
+                timeout=60,
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+            )
+        return self._http_client
+
+    async def aclose(self):
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+    def _optimize_llm_request(self, user_prompt, system_prompt, stream=False):
         headers = {
             "Content-Type": "application/json",
             "api-key": AZURE_OPENAI_API_KEY,
@@ -138,33 +190,49 @@ Tailor your response to the intent behind the HR query, which may involve:
             "presence_penalty": 0,
             "max_tokens": 6144,
         }
+        if stream:
+            body["stream"] = True
 
         url = f"{AZURE_OPENAI_ENDPOINT}/openai/deployments/{AZURE_OPENAI_DEPLOYMENT}/chat/completions?api-version={AZURE_OPENAI_API_VERSION}"
+        return url, headers, body
 
-        async with httpx.AsyncClient(timeout=60) as client:
-            res = await client.post(url, headers=headers, json=body)
-            res.raise_for_status()
-            response = res.json()
-            return response["choices"][0]["message"]["content"]
+    async def _generate_optimize_llm(self, user_prompt, system_prompt=""):
+        url, headers, body = self._optimize_llm_request(user_prompt, system_prompt)
+
+        res = await self.get_http_client().post(url, headers=headers, json=body)
+        res.raise_for_status()
+        response = res.json()
+        return response["choices"][0]["message"]["content"]
 
-import json
+    async def _stream_optimize_llm(self, user_prompt, system_prompt=""):
+        url, headers, body = self._optimize_llm_request(user_prompt, system_prompt, stream=True)
 
-def append_naive_log(query, context, response, log_path="naiveRag_query_logs.json"):
+        async with self.get_http_client().stream("POST", url, headers=headers, json=body) as res:
+            res.raise_for_status()
+            async for line in res.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = loads(data).get("choices") or []
+                if not choices:
+                    continue
+                piece = (choices[0].get("delta") or {}).get("content")
+                if piece:
+                    yield piece
+
+def build_context(retrieved_chunks):
+    return "\n\n".join([f"- {chunk}" for chunk in retrieved_chunks])
+
+# JSON Lines: one append per query instead of re-reading and rewriting the whole log. The write is a
+# single synchronous call, so concurrent requests on the event loop can't interleave lines.
+def append_naive_log(query, context, response, log_path="naiveRag_query_logs.jsonl"):
     entry = {
         "query": query,
         "context": context,
         "response": response
     }
 
-    if not os.path.exists(log_path):
-        with open(log_path, "w") as f:
-            json.dump([], f)
-
-    with open(log_path, "r+", encoding="utf-8") as f:
-        try:
-            data = json.load(f)
-        except json.JSONDecodeError:
-            data = []
-        data.append(entry)
-        f.seek(0)
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    with open(log_path, "a", encoding="utf-8") as f:
+        f.write(dumps(entry) + "\n")
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 from pipeline.retriever import Retriever
@@ -25,3 +26,12 @@ class RAGPipeline:
         retrieved_chunks = self.retriever.query(query, top_k=5)
         answer, response = self.generator.generate_response(query, retrieved_chunks)
         return response
+
+    async def process_queries(self, queries, top_k=5):
+        logging.info(f"\n⏳ Processing {len(queries)} queries as a batch")
+        retrieved = self.retriever.batch_query(queries, top_k=top_k)
+        results = await asyncio.gather(*(
+            self.generator.generate_response(query, chunks)
+            for query, chunks in zip(queries, retrieved)
+        ))
+        return [response for _, response in results]
@@ -1,5 +1,7 @@
 import os
 import logging
+import threading
+from collections import OrderedDict
 import chromadb
 from sentence_transformers import SentenceTransformer
 
@@ -10,12 +12,21 @@ logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "2048"))
+# Upper bound on n_results; larger values force HNSW to widen its search beyond search_ef
+MAX_TOP_K = int(os.getenv("RETRIEVER_MAX_TOP_K", "200"))
+QUERY_ENCODE_BATCH_SIZE = int(os.getenv("QUERY_ENCODE_BATCH_SIZE", "32"))
+
 class Retriever:
     def __init__(self, db_path="data/vector_db", collection_name="resumes"):
         self.client = chromadb.PersistentClient(path=db_path)
         self.collection = self.client.get_collection(name=collection_name)
         self.embedding_model = SentenceTransformer("BAAI/bge-base-en-v1.5")
         logging.info("🔄 Loaded embedding model: BAAI/bge-base-en-v1.5")
+        # Per-instance LRU of query text -> embedding (tuple, so it is immutable), shared by the
+        # single-query and batched paths
+        self._query_embeddings = OrderedDict()
+        self._embed_lock = threading.Lock()
 
         total = self.collection.count()
         if total == 0:
@@ -23,10 +34,36 @@ class Retriever:
         else:
             logging.info(f"✅ ChromaDB contains {total} documents.")
 
+    def _embed_queries(self, texts):
+        """Embeddings for `texts`: cached ones are reused and only the misses are encoded, in one batch."""
+        found = {}
+        with self._embed_lock:
+            for text in texts:
+                if text in self._query_embeddings:
+                    self._query_embeddings.move_to_end(text)
+                    found[text] = self._query_embeddings[text]
+
+        misses = [text for text in dict.fromkeys(texts) if text not in found]
+        if misses:
+            vectors = self.embedding_model.encode(
+                [f"Represent this query for retrieval: {text}" for text in misses],
+                batch_size=QUERY_ENCODE_BATCH_SIZE,
+                normalize_embeddings=True,
+                convert_to_numpy=True
+            )
+            with self._embed_lock:
+                for text, vector in zip(misses, vectors):
+                    found[text] = self._query_embeddings[text] = tuple(vector.tolist())
+                while len(self._query_embeddings) > QUERY_EMBED_CACHE_SIZE:
+                    self._query_embeddings.popitem(last=False)
+        return [found[text] for text in texts]
+
+    def _embed_query(self, text):
+        return self._embed_queries([text])[0]
+
     def get_embedding(self, text):
         try:
-            prompt = f"Represent this query for retrieval: {text}"
-            return self.embedding_model.encode(prompt, normalize_embeddings=True).tolist()
+            return list(self._embed_query(text))
         except Exception as e:
             logging.error(f"❌ Embedding error: {e}")
             return None
@@ -37,6 +74,9 @@ class Retriever:
         embedding = self.get_embedding(query_text)
         if not embedding:
             return [], []
+        if top_k > MAX_TOP_K:
+            logging.info(f"✂️ Clamping top_k from {top_k} to {MAX_TOP_K}")
+            top_k = MAX_TOP_K
         print(f"retrieving top {top_k} chunks")
         results = self.collection.query(query_embeddings=[embedding], n_results=top_k)
 
@@ -47,3 +87,21 @@ class Retriever:
 
         logging.info(f"✅ Retrieved {len(chunks)} chunks.")
         return chunks
+
+    def batch_query(self, query_texts, top_k=100):
+        """Embed several queries in one encode call and run them as one Chroma query."""
+        logging.info(f"🔍 Batch querying {len(query_texts)} queries")
+        top_k = min(top_k, MAX_TOP_K)
+
+        # Repeated queries come from the embedding cache; only new ones reach the model
+        embeddings = self._embed_queries(query_texts)
+        # Chroma runs all ANN searches in one call; only metadata (which holds the text) is needed
+        results = self.collection.query(
+            query_embeddings=[list(embedding) for embedding in embeddings],
+            n_results=top_k,
+            include=["metadatas"]
+        )
+
+        batches = [[meta["text"] for meta in metas] for metas in results.get("metadatas") or []]
+        logging.info(f"✅ Retrieved {sum(len(b) for b in batches)} chunks for {len(batches)} queries.")
+        return batches
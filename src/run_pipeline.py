@@ -1,5 +1,7 @@
 import os
 import sys
+import json
+import asyncio
 from pipeline.pipeline import RAGPipeline
 
 # Fix sys.path for relative import
@@ -19,10 +21,27 @@ def main():
         print("❌ Vector DB not found or empty. Run vector_store.py first.")
         sys.exit(1)
 
+    # Optional JSON list of queries (e.g. compare/queries.json), answered as one batch
+    queries_file = sys.argv[1] if len(sys.argv) > 1 else None
+
     print("\n🔍 HR RAG Bot is ready.")
     use_openai = input("Use OpenAI for generation? (y/n): ").strip().lower() == "y"
     use_optimize_llm = input("Use OptimizeRag Azure LLM instead? (y/n): ").strip().lower() == "y"
-    
+
+    if queries_file:
+        with open(queries_file, encoding="utf-8") as f:
+            queries = json.load(f)
+
+        # One batched retrieval for every query, then the answers are generated concurrently
+        rag = RAGPipeline(use_openai=use_openai, use_optimize_llm=use_optimize_llm)
+        print(f"\n⏳ Processing {len(queries)} queries as a batch...")
+        results = asyncio.run(rag.process_queries(queries))
+
+        for query, result in zip(queries, results):
+            print(f"\n🔍 Query: {query}\n🧠 Generated Response:\n")
+            print(result)
+        return
+
     query = input("\nEnter your query (or leave blank for default): ").strip()
     if not query:
         query = "Find candidates with React and UX design internships"
@@ -0,0 +1,45 @@
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from common.json_io import load_query_log  # noqa: E402
+
+
+def write_legacy(path, records):
+    path.write_text(json.dumps(records), encoding="utf-8")
+
+
+def write_jsonl(path, records):
+    path.write_text("".join(json.dumps(r) + "\n" for r in records), encoding="utf-8")
+
+
+def test_legacy_array_only(tmp_path):
+    legacy = [{"query": "a", "response": "1"}, {"query": "b", "response": "2"}]
+    write_legacy(tmp_path / "naiveRag_query_logs.json", legacy)
+
+    assert load_query_log(tmp_path / "naiveRag_query_logs.json") == legacy
+
+
+def test_jsonl_only(tmp_path):
+    write_jsonl(tmp_path / "naiveRag_query_logs.jsonl", [{"query": "a", "response": "1"}])
+
+    assert load_query_log(tmp_path / "naiveRag_query_logs.json") == [{"query": "a", "response": "1"}]
+
+
+def test_legacy_and_jsonl_are_merged_with_latest_entry_winning(tmp_path):
+    write_legacy(tmp_path / "naiveRag_query_logs.json", [
+        {"query": "a", "response": "old a"},
+        {"query": "b", "response": "old b"},
+    ])
+    write_jsonl(tmp_path / "naiveRag_query_logs.jsonl", [
+        {"query": "b", "response": "new b"},
+        {"query": "c", "response": "new c"},
+    ])
+
+    assert load_query_log(tmp_path / "naiveRag_query_logs.json") == [
+        {"query": "a", "response": "old a"},
+        {"query": "b", "response": "new b"},
+        {"query": "c", "response": "new c"},
+    ]
@@ -0,0 +1,102 @@
+import os
+import sys
+import json
+import asyncio
+import hashlib
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("httpx")
+pytest.importorskip("dotenv")
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path[:0] = [SRC, os.path.join(SRC, "evaluator")]
+
+from evaluator.semantic_cache import SemanticCache  # noqa: E402
+
+# Long enough that the golden block alone fills the fake encoder's window, like MiniLM's 256 tokens
+GOLDEN = [{"resume": f"Candidate {i}", "reason": "Five years of Python and AWS. " * 4} for i in range(20)]
+CONTEXT = "Resume excerpts retrieved for the query. " * 50
+TRUNCATE_AT = 512
+
+
+class TruncatingEncoder:
+    """Hashed bag-of-words over the first TRUNCATE_AT characters, L2-normalised."""
+
+    def encode(self, texts, normalize_embeddings=True, **kwargs):
+        single = isinstance(texts, str)
+        vectors = np.zeros((1 if single else len(texts), 64), dtype=np.float32)
+        for row, text in enumerate([texts] if single else texts):
+            for word in text[:TRUNCATE_AT].lower().split():
+                vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % 64] += 1.0
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors[0] if single else vectors
+
+
+@pytest.fixture
+def evaluate(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    import evaluate
+
+    cache = SemanticCache(tmp_path / "eval_cache.pkl", "fake", threshold=0.95)
+    cache.model = TruncatingEncoder()
+    monkeypatch.setattr(evaluate, "_semantic_cache", cache)
+    monkeypatch.setattr(evaluate, "SEMANTIC_CACHE_ENABLED", True)
+    monkeypatch.setattr(evaluate, "LLM_CACHE_ENABLED", False)
+    monkeypatch.setattr(evaluate, "COMBINED_EVAL_PROMPT", True)
+
+    calls = []
+
+    async def fake_fetch_completion(url, headers, body):
+        calls.append(body)
+        section = {"score": len(calls), "missing_info": [], "noise": [], "percent_matched": 100}
+        return json.dumps({"faithfulness": section, "context_recall": section, "resume_mention": section})
+
+    monkeypatch.setattr(evaluate, "fetch_completion", fake_fetch_completion)
+    evaluate.fake_calls = calls
+    return evaluate
+
+
+def run(evaluate, answer):
+    log_entry = {"query": "Python developers with AWS", "response": answer, "context": CONTEXT}
+    return asyncio.run(evaluate.run_all_evals(log_entry["query"], GOLDEN, log_entry))
+
+
+def test_different_prompts_do_not_collide_in_semantic_cache(evaluate):
+    cache = evaluate._semantic_cache
+    golden_text, names_list = evaluate.format_golden(GOLDEN)
+    answer = "Alice Smith and Bob Jones both fit: Python plus AWS."
+    other_answer = "Only Carol White matches; nobody else has the AWS background."
+
+    # The full prompts share a prefix longer than the encoder's window, so embedding them can't tell them apart
+    full = [evaluate.make_combined_eval_prompt(golden_text, names_list, a, CONTEXT) for a in (answer, other_answer)]
+    assert float(cache.embed(full[0]) @ cache.embed(full[1])) == pytest.approx(1.0)
+
+    namespace, text = evaluate.make_semantic_key("combined", answer, golden_text, names_list, CONTEXT)
+    cache.add(cache.embed(text), "first verdict", namespace)
+
+    different_answer = evaluate.make_semantic_key("combined", other_answer, golden_text, names_list, CONTEXT)
+    different_context = evaluate.make_semantic_key("combined", answer, golden_text, names_list, CONTEXT + "One more resume.")
+    different_check = evaluate.make_semantic_key("faithfulness", answer, golden_text)
+    for other_namespace, other_text in (different_answer, different_context, different_check):
+        assert cache.lookup(cache.embed(other_text), other_namespace) is None
+    assert cache.lookup(cache.embed(text), namespace) == "first verdict"
+
+
+def test_different_answers_under_same_golden_do_not_collide(evaluate):
+    first = run(evaluate, "Alice Smith and Bob Jones both fit: Python plus AWS.")
+    second = run(evaluate, "Only Carol White matches; nobody else has the AWS background.")
+
+    assert len(evaluate.fake_calls) == 2
+    assert first[0]["score"] == 1
+    assert second[0]["score"] == 2
+
+
+def test_repeated_answer_is_served_from_semantic_cache(evaluate):
+    answer = "Alice Smith and Bob Jones both fit: Python plus AWS."
+    first = run(evaluate, answer)
+    second = run(evaluate, answer)
+
+    assert len(evaluate.fake_calls) == 1
+    assert second[0]["score"] == first[0]["score"]